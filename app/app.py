@@ -61,11 +61,13 @@ class App:
             asf_files = self.get_asf_files()
 
             txt_path = self.settings['path_to_txt_file']
+            use_cache = self.settings.get('use_cache', True)
+            reinforcement_groups = self.settings['reinforcement_groups']
+
             scad_data = SCADData()
-            scad_data.import_txt(txt_path)
+            scad_data.import_txt(txt_path, use_cache=use_cache, groups=reinforcement_groups)
 
             background_reinforcement_intensity = self.settings['background_reinforcement_intensity']
-            reinforcement_groups = self.settings['reinforcement_groups']
 
             for group in reinforcement_groups:
                 asf_file_index = None
@@ -78,7 +80,7 @@ class App:
                     raise AssertionError(f'Group {group} not found in asf files')
 
                 reinforcement = ReinforcementData()
-                reinforcement.import_asf(asf_files[asf_file_index])
+                reinforcement.import_asf(asf_files[asf_file_index], use_cache=use_cache)
 
                 reinforcement_scheme = ReinforcementScheme()
 
@@ -94,12 +96,9 @@ class App:
 
                 reinforcement_scheme.load_scad_data(scad_data, group)
                 reinforcement_scheme.load_anchorage_lengths(self.settings['path_to_csv_file'])
-                reinforcement_scheme.make_combined_table()
+                reinforcement_scheme.make_combined_table(use_cache=use_cache)
 
-                for loc in ['Top_X', 'Top_Y', 'Bot_X', 'Bot_Y']:
-                    reinforcement_scheme.find_reinforcement_zones(loc)
-                    reinforcement_scheme.transfer_reinforcement_direction_to_zones()
-                    reinforcement_scheme.set_zones_reinforcement()
+                reinforcement_scheme.process_locations(['Top_X', 'Top_Y', 'Bot_X', 'Bot_Y'])
 
                 drawer = Drawer()
                 dxf_file = f'{self.settings["path_to_dxf_output_folder"]}/{group}.dxf'
@@ -31,15 +31,7 @@ if __name__ == '__main__':
     reinforcement_scheme.load_anchorage_lengths(f'{work_dir}/{csv_file}')
     reinforcement_scheme.make_combined_table()
 
-    for loc in [
-        'Top_X',
-        'Top_Y',
-        'Bot_X',
-        'Bot_Y'
-    ]:
-        reinforcement_scheme.find_reinforcement_zones(loc)
-        reinforcement_scheme.transfer_reinforcement_direction_to_zones()
-        reinforcement_scheme.set_zones_reinforcement()
+    reinforcement_scheme.process_locations(['Top_X', 'Top_Y', 'Bot_X', 'Bot_Y'])
 
     drawer = Drawer()
     drawer.dxf_draw_zones(reinforcement_scheme, f'{work_dir}/{example_name}.dxf')
@@ -1,32 +1,41 @@
 from utils.reinforcement_calculator import ReinforcementCalculator
-from structures.reinforcement_zone import ReinforcementZone
+from structures.reinforcement_zone import ReinforcementZone, ZoneSet
 from utils.reinforcement_data import ReinforcementData
 from utils.scad_data import SCADData
+from utils.mesh_tools import Connectivity, MeshTools, NodeElementIndex
+from utils.model_cache import model_cache
 from utils.decorators import Decorators
-from typing import List, Optional
-from numpy import intersect1d
+from typing import List, Optional, Sequence, Union
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
+import hashlib
+import os
 
 
 class ReinforcementScheme:
     def __init__(self):
         self.nodes_table = None
         self.elements_table = None
+        self.connectivity = None
+        self.node_element_index = None
         self.calculator = ReinforcementCalculator()
         self.reinforcement_data = None
-        self.reinforcement_zones = {'Top_X': [],
-                                    'Top_Y': [],
-                                    'Bot_X': [],
-                                    'Bot_Y': [],
-                                    'Lat_X': [],
-                                    'Lat_Y': [],
+        self.reinforcement_zones = {'Top_X': ZoneSet(calculator=self.calculator),
+                                    'Top_Y': ZoneSet(calculator=self.calculator),
+                                    'Bot_X': ZoneSet(calculator=self.calculator),
+                                    'Bot_Y': ZoneSet(calculator=self.calculator),
+                                    'Lat_X': ZoneSet(calculator=self.calculator),
+                                    'Lat_Y': ZoneSet(calculator=self.calculator),
                                     }
         self.scad_data = SCADData()
         self.background_reinforcement = {'diameter': 0,
                                          'step': 0}
         self.anchorage_lengths = None
         self.polygons = []
+        self.match_tolerance = 1e-3
+        self.hull_min_nodes = 64
+        self.minimum_area_rectangles = False
 
     @Decorators.timed
     def load_reinforcement_data(self, reinforcement_data: ReinforcementData):
@@ -42,8 +51,12 @@ class ReinforcementScheme:
 
     def load_scad_data(self, scad_data: SCADData, name: str):
         self.scad_data = SCADData()
-        self.scad_data.elements_table = scad_data.elements_table.loc[scad_data.reinforcement_groups[name]]
+        group_elements = scad_data.group_elements(name)
+
+        self.scad_data.elements_table = scad_data.elements_table.loc[group_elements]
+        self.scad_data.connectivity = scad_data.connectivity.subset(group_elements)
         self.scad_data.nodes_table = scad_data.nodes_table
+        self.scad_data.directions = scad_data.directions
 
     @Decorators.timed
     def find_reinforcement_zones(self, location, min_value=None):
@@ -52,137 +65,188 @@ class ReinforcementScheme:
         if min_value is None:
             min_value = self.background_reinforcement_intensity
 
-        reinforced_elements = self.elements_table.query(f'{location} > {min_value}')
-        reinforced_elements_indices = reinforced_elements.index.to_list()
-
-        while len(reinforced_elements_indices) > 0:
-            first_element = reinforced_elements_indices.pop(0)
-            first_element_nodes = self.elements_table.loc[first_element].Nodes
-
-            zone = ReinforcementZone(self.calculator)
-            zone.add_one_element_to_zone(first_element, first_element_nodes)
-
-            while True:
-                next_elements = self.find_elements_with_nodes(self.elements_table, zone.nodes)
-                next_elements = intersect1d(next_elements, reinforced_elements_indices)
-
-                if len(next_elements) > 0:
-                    nodes = np.stack(self.elements_table.loc[next_elements].Nodes.values).flatten()
-                    zone.add_multiple_elements_to_zone(next_elements, nodes)
-                    reinforced_elements_indices = [element for element in reinforced_elements_indices
-                                                   if element not in next_elements]
-                else:
-                    break
-
-            self.reinforcement_zones[location].append(zone)
-
-    def reset_reinforcement_zones(self):
-        self.reinforcement_zones = {'Top_X': [],
-                                    'Top_Y': [],
-                                    'Bot_X': [],
-                                    'Bot_Y': [],
-                                    'Lat_X': [],
-                                    'Lat_Y': [],
-                                    }
-
-    @staticmethod
-    @Decorators.timed
-    def find_elements_with_nodes(elements_table: pd.DataFrame, nodes_to_find: List[int]) -> List[int]:
-        result_elements = []
-
-        nodes = np.stack(elements_table.Nodes.values)
-        search_result = [np.where(nodes == node)[0] for node in nodes_to_find]
-        for item in search_result:
-            result_elements += elements_table.iloc[item].index.tolist()
+        intensities = self.elements_table[location].values
+        reinforced_elements = self.elements_table.index.values[intensities > min_value]
 
-        result_elements = list(np.unique(result_elements))
+        if self.node_element_index is None:
+            self.node_element_index = NodeElementIndex(self.connectivity)
 
-        return result_elements
+        components = self.node_element_index.connected_components(reinforced_elements)
+        self.reinforcement_zones[location] = ZoneSet.concatenate([self.reinforcement_zones[location],
+                                                                  self.make_zones(reinforced_elements, components)])
 
     @Decorators.timed
-    def transfer_reinforcement_direction_to_zones(self):
-        for location in self.reinforcement_zones.keys():
-            for zone in self.reinforcement_zones[location][:]:
-                zone_directions = self.elements_table.loc[zone.elements, ['Rotation_type', 'Direction']]
-
-                if all([coordinate != 0 for coordinate in zone.reinforcement_direction_vector]):
-                    continue
-
-                if (len(np.unique(np.stack(zone_directions.Direction.values), axis=0)) == 1 and
-                        len(zone_directions.Rotation_type.unique()) == 1):
-                    rotation_type = zone_directions.Rotation_type.unique()[0]
-                    direction = np.unique(np.stack(zone_directions.Direction.values), axis=0)[0]
-
-                    if rotation_type == 'EX':
-                        zone.set_reinforcement_direction(*direction)
-                    elif rotation_type == 'EY':
-                        ey_direction = direction
-                        ey_to_ex_rotation = np.array([[0, 1, 0],
-                                                      [-1, 0, 0],
-                                                      [0, 0, 1]])
-                        ex_direction = ey_to_ex_rotation @ ey_direction
-                        zone.set_reinforcement_direction(*ex_direction)
-
-                    zone.set_bounding_rectangle(self.get_zone_bounding_rectangle(zone))
-
-                    if 'X' in location:
-                        zone.reinforcement_direction = 'X'
-                    elif 'Y' in location:
-                        zone.reinforcement_direction = 'Y'
-
-                elif len(zone_directions.Rotation_type.unique()) == 1:
-                    rotation_type = zone_directions.Rotation_type.unique()[0]
-                    directions = np.unique(np.stack(zone_directions.Direction.values), axis=0)
-                    for direction in directions:
-                        direction_filter = [all(item) for item in
-                                            np.stack(zone_directions.Direction.values) == direction]
+    def sweep_reinforcement_zones(self, location: str, min_values: Sequence[float]) -> List[ZoneSet]:
+        """Zones of location for each of min_values, as find_reinforcement_zones would find them, in one pass over the
+        elements in order of decreasing intensity. Zones are returned without changing reinforcement_zones"""
+        assert isinstance(self.elements_table, pd.DataFrame), 'No reinforcement data'
 
-                        new_zone_indices = zone_directions.iloc[direction_filter].index
-                        new_zone_elements = new_zone_indices.to_list()
-                        new_zone_nodes = np.stack(self.elements_table.loc[new_zone_elements].Nodes.values)
-                        new_zone_nodes = np.unique(new_zone_nodes)
+        if self.node_element_index is None:
+            self.node_element_index = NodeElementIndex(self.connectivity)
 
-                        new_zone = ReinforcementZone(self.calculator)
-                        new_zone.add_multiple_elements_to_zone(new_zone_elements, new_zone_nodes)
+        elements = self.elements_table.index.values
+        components = self.node_element_index.threshold_components(elements, self.elements_table[location].values,
+                                                                  min_values)
 
-                        if rotation_type == 'EX':
-                            new_zone.set_reinforcement_direction(*direction)
+        return [self.make_zones(elements[element_components >= 0], element_components[element_components >= 0])
+                for element_components in components]
 
-                        new_zone.set_bounding_rectangle(self.get_zone_bounding_rectangle(new_zone))
+    def make_zones(self, elements: np.array, components: np.array) -> ZoneSet:
+        """Zone for every component of elements, in order of component labels"""
+        return ZoneSet.from_groups(elements, components, self.connectivity, self.calculator)
 
-                        if 'X' in location:
-                            new_zone.reinforcement_direction = 'X'
-                        elif 'Y' in location:
-                            new_zone.reinforcement_direction = 'Y'
+    @Decorators.timed
+    def process_locations(self, locations: Sequence[str] = ('Top_X', 'Top_Y', 'Bot_X', 'Bot_Y'),
+                          workers: Optional[int] = None):
+        """Find zones, transfer directions and set reinforcement of every location once. Locations are processed in a
+        thread pool sharing the combined table"""
+        for location in locations:
+            assert location in self.reinforcement_zones, f'Unknown reinforcement location "{location}"'
+
+        if self.node_element_index is None:
+            self.node_element_index = NodeElementIndex(self.connectivity)
+
+        if workers == 1 or len(locations) < 2:
+            for location in locations:
+                self.process_location(location)
+            return
+
+        with ThreadPoolExecutor(max_workers=workers or min(len(locations), os.cpu_count() or 1)) as executor:
+            for future in [executor.submit(self.process_location, location) for location in locations]:
+                future.result()
+
+    def process_location(self, location: str):
+        self.find_reinforcement_zones(location)
+        self.transfer_reinforcement_direction_to_zones([location])
+        self.set_zones_reinforcement([location])
 
-                        self.reinforcement_zones[location].append(new_zone)
+    def reset_reinforcement_zones(self):
+        self.reinforcement_zones = {'Top_X': ZoneSet(calculator=self.calculator),
+                                    'Top_Y': ZoneSet(calculator=self.calculator),
+                                    'Bot_X': ZoneSet(calculator=self.calculator),
+                                    'Bot_Y': ZoneSet(calculator=self.calculator),
+                                    'Lat_X': ZoneSet(calculator=self.calculator),
+                                    'Lat_Y': ZoneSet(calculator=self.calculator),
+                                    }
 
-                    self.reinforcement_zones[location].remove(zone)
+    @Decorators.timed
+    def transfer_reinforcement_direction_to_zones(self, locations: Optional[Sequence[str]] = None):
+        """Set force direction of zones with one rotation type and direction, split zones with one rotation type and
+        several directions into zones by direction. Zones are grouped on (zone, direction id) keys in one sort"""
+        for location in self.reinforcement_zones.keys() if locations is None else locations:
+            zones = self.reinforcement_zones[location]
+            pending = np.flatnonzero(~np.all(zones.direction_vectors != 0, axis=1))
+            if len(pending) == 0:
+                continue
+
+            pending_zones = zones.take(pending)
+            zone_starts = pending_zones.element_offsets[:-1]
+            elements = pending_zones.elements
+            positions = self.elements_table.index.get_indexer(elements)
+            rotation_codes = self.elements_table['Rotation_code'].values[positions]
+            direction_ids = self.elements_table['Direction_id'].values[positions]
+
+            single_code = (np.minimum.reduceat(rotation_codes, zone_starts) ==
+                           np.maximum.reduceat(rotation_codes, zone_starts))
+            single_direction = single_code & (np.minimum.reduceat(direction_ids, zone_starts) ==
+                                              np.maximum.reduceat(direction_ids, zone_starts))
+            split = single_code & ~single_direction
+
+            zone_ids = pending_zones.element_zones
+            selected = single_code[zone_ids]
+            if not selected.any():
+                continue
+
+            order = np.flatnonzero(selected)[np.lexsort((direction_ids[selected], zone_ids[selected]))]
+            group_starts = np.concatenate(([True], (np.diff(zone_ids[order]) != 0) |
+                                           (np.diff(direction_ids[order]) != 0)))
+            groups = np.cumsum(group_starts) - 1
+            group_zones = zone_ids[order][group_starts]
+            group_codes = rotation_codes[order][group_starts]
+            group_directions = self.scad_data.direction_vectors(direction_ids[order][group_starts])
+
+            ey_to_ex_rotation = np.array([[0, 1, 0],
+                                          [-1, 0, 0],
+                                          [0, 0, 1]])
+            ex = group_codes == SCADData.rotation_types.index('EX')
+            ey = group_codes == SCADData.rotation_types.index('EY')
+
+            split_groups = split[group_zones]
+            split_elements = split_groups[groups]
+            new_zones = ZoneSet.from_groups(elements[order][split_elements], groups[split_elements], self.connectivity,
+                                            self.calculator)
+            new_zones.set_direction_vectors(ex[split_groups], group_directions[ex & split_groups])
+
+            kept = pending[group_zones[~split_groups]]
+            zones.set_direction_vectors(kept[ex[~split_groups]], group_directions[ex & ~split_groups])
+            zones.set_direction_vectors(kept[ey[~split_groups]],
+                                        group_directions[ey & ~split_groups] @ ey_to_ex_rotation.T)
+
+            remaining = np.setdiff1d(np.arange(len(zones)), pending[split])
+            zones = ZoneSet.concatenate([zones.take(remaining), new_zones])
+            directed = np.concatenate((np.searchsorted(remaining, kept), len(remaining) + np.arange(len(new_zones))))
+
+            if 'X' in location:
+                zones.set_reinforcement_directions(directed, 'X')
+            elif 'Y' in location:
+                zones.set_reinforcement_directions(directed, 'Y')
+
+            zones.set_bounding_rectangles(directed, self.get_zone_bounding_rectangles([zones[i] for i in directed])
+                                          .transpose(0, 2, 1))
+
+            self.reinforcement_zones[location] = zones
 
     def get_zone_bounding_rectangle(self, zone: ReinforcementZone) -> np.array:
-        zone_nodes = self.nodes_table.loc[zone.nodes]
-
-        rotation_matrix = self.make_rotation_matrix_2d(*zone.reinforcement_direction_vector[:2])
-        zone_nodes_coordinates = zone_nodes.loc[:, ['X', 'Y']]
-        local_coordinates = (np.linalg.inv(rotation_matrix) @ zone_nodes_coordinates.values.T).T
-
-        min_x_local, min_y_local = local_coordinates[:, 0].min(), local_coordinates[:, 1].min()
-        max_x_local, max_y_local = local_coordinates[:, 0].max(), local_coordinates[:, 1].max()
-
-        points_local = np.array([[min_x_local, min_y_local],
-                                 [min_x_local, max_y_local],
-                                 [max_x_local, max_y_local],
-                                 [max_x_local, min_y_local],
-                                 ])
-        points_global = rotation_matrix @ points_local.T
-        return points_global
+        return self.get_zone_bounding_rectangles([zone])[0]
+
+    def get_zone_bounding_rectangles(self, zones: Sequence[ReinforcementZone]) -> np.array:
+        """(n, 2, 4) bounding rectangles of zones along their reinforcement directions. With minimum_area_rectangles
+        zones without direction are first given the direction of their minimum area rectangle"""
+        if len(zones) == 0:
+            return np.empty((0, 2, 4))
+
+        zone_points = self.zone_hull_points(zones)
+
+        if self.minimum_area_rectangles:
+            for zone, points in zip(zones, zone_points):
+                if not any(zone.reinforcement_direction_vector):
+                    angle = MeshTools.minimum_area_rectangle_angle(MeshTools.convex_hull(points))
+                    zone.set_reinforcement_direction(np.cos(angle), np.sin(angle), 0)
+
+        directions = np.array([zone.reinforcement_direction_vector[:2] for zone in zones], dtype=float)
+        angles = np.arctan(directions[:, 1] / (directions[:, 0] + 1e-9))
+
+        return MeshTools.oriented_bounding_rectangles(np.concatenate(zone_points),
+                                                      [len(points) for points in zone_points], angles)
+
+    def zone_hull_points(self, zones: Sequence[ReinforcementZone]) -> List[np.array]:
+        """XY points bounding each zone: its convex hull, computed and cached for zones with at least hull_min_nodes
+        nodes, or its node coordinates for smaller zones"""
+        zone_points = [zone.hull for zone in zones]
+        missing = [i for i, points in enumerate(zone_points) if points is None]
+        if len(missing) == 0:
+            return zone_points
+
+        nodes = np.concatenate([zones[i].nodes for i in missing])
+        positions = MeshTools.index_positions(self.nodes_table.index.values, nodes)
+        assert np.all(positions >= 0), 'Zone nodes not in Nodes table'
+
+        coordinates = self.nodes_table[['X', 'Y']].values[positions].astype(float)
+        zone_starts = np.cumsum([len(zones[i].nodes) for i in missing])[:-1]
+        for i, zone_coordinates in zip(missing, np.split(coordinates, zone_starts)):
+            if len(zone_coordinates) >= self.hull_min_nodes:
+                zones[i].hull = MeshTools.convex_hull(zone_coordinates)
+                zone_coordinates = zones[i].hull
+            zone_points[i] = zone_coordinates
+
+        return zone_points
 
     def set_background_reinforcement(self, reinforcement_data: Optional[ReinforcementData] = None, auto: bool = True,
                                      reinforcement: Optional[dict] = None, intensity: Optional[float] = 0.):
 
         if auto:
-            quantiles = reinforcement_data.reinforcement_table.loc[:, ['Top_X', 'Top_Y',
-                                                                       'Bot_X', 'Bot_Y']].quantile(0.8)
+            quantiles = pd.concat([reinforcement_data.reinforcement_column(location)
+                                   for location in ['Top_X', 'Top_Y', 'Bot_X', 'Bot_Y']], axis=1).quantile(0.8)
             self.background_reinforcement = self.calculator.reinforcement_from_intensity(quantiles.max())
         else:
             if reinforcement is not None and intensity == 0:
@@ -196,94 +260,116 @@ class ReinforcementScheme:
             else:
                 raise ValueError('Manual background reinforcement error')
 
-    def set_zones_reinforcement(self):
-        for location in self.reinforcement_zones:
-            for zone in self.reinforcement_zones[location]:  # type: ReinforcementZone
-                max_intensity = self.elements_table.loc[zone.elements, location].max()
+    def set_zones_reinforcement(self, locations: Optional[Sequence[str]] = None):
+        for location in self.reinforcement_zones.keys() if locations is None else locations:
+            zones = self.reinforcement_zones[location]  # type: ZoneSet
 
-                zone.max_intensity = max_intensity
-                zone.background_reinforcement = self.background_reinforcement
-                zone.background_reinforcement_intensity = self.background_reinforcement_intensity
+            if len(zones.elements) > 0:
+                positions = self.elements_table.index.get_indexer(zones.elements)
+                intensities = self.elements_table[location].values[positions]
+                zones.set_max_intensities(slice(None), np.maximum.reduceat(intensities, zones.element_offsets[:-1]))
 
-                if self.anchorage_lengths is not None:
-                    zone.anchorage_lengths = self.anchorage_lengths
+            zones.set_background_reinforcement(self.background_reinforcement, self.background_reinforcement_intensity)
+
+            if self.anchorage_lengths is not None:
+                zones.set_anchorage_lengths(self.anchorage_lengths)
+
+    matches_cache_version = 1
 
     @Decorators.timed
-    def make_combined_table(self):
+    def make_combined_table(self, engine: str = 'sorted', use_cache: bool = True):
+        """Add QM intensities and SCAD force directions to ASF elements matched by element centers.
+
+        The sorted engine pairs elements of the tables sorted by their centers and falls back to the hash engine when
+        the tables do not pair up. The hash engine looks up every element center in a spatial hash of the centers.
+        Matches are cached next to the ASF file under a fingerprint of the meshes"""
+        assert engine in ('sorted', 'hash'), f'Unknown combine engine "{engine}"'
+
         elements_table = self.reinforcement_data.elements_table
-        direction_series = pd.Series(name='Direction', dtype=object)
+        reinforcement_table = self.reinforcement_data.reinforcement_table
+        center_columns = ['Element_center_X', 'Element_center_Y', 'Element_center_Z']
 
-        centers_table = self.calculate_element_centers(self.scad_data.elements_table.Nodes, self.scad_data.nodes_table)
+        centers_table = self.calculate_element_centers(self.scad_data.connectivity, self.scad_data.nodes_table)
         self.scad_data.elements_table = pd.concat([self.scad_data.elements_table, centers_table], axis=1)
 
-        for element in elements_table.index:
-            element_center = elements_table.loc[element, ['Element_center_X',
-                                                          'Element_center_Y',
-                                                          'Element_center_Z']].values
-
-            x_con = abs(self.reinforcement_data.reinforcement_table.loc[:, 'Element_center_X'] -
-                        element_center[0]) < 1e-3
-            y_con = abs(self.reinforcement_data.reinforcement_table.loc[:, 'Element_center_Y'] -
-                        element_center[1]) < 1e-3
-            z_con = abs(self.reinforcement_data.reinforcement_table.loc[:, 'Element_center_Z'] -
-                        element_center[2]) < 1e-3
-
-            reinforcement_index = self.reinforcement_data.reinforcement_table.loc[x_con & y_con & z_con].iloc[0].name
-            for column in ['Top_X', 'Top_Y', 'Lat_X', 'Bot_X', 'Bot_Y', 'Lat_Y']:
-                elements_table.loc[element, column] = self.reinforcement_data.reinforcement_table.loc[
-                    reinforcement_index, column]
-
-            x_con = abs(self.scad_data.elements_table.loc[:, 'Element_center_X'] - element_center[0]) < 1e-3
-            y_con = abs(self.scad_data.elements_table.loc[:, 'Element_center_Y'] - element_center[1]) < 1e-3
-            z_con = abs(self.scad_data.elements_table.loc[:, 'Element_center_Z'] - element_center[2]) < 1e-3
-            scad_element = self.scad_data.elements_table.loc[x_con & y_con & z_con].iloc[0]
-            scad_index = scad_element.name
-            elements_table.loc[element, 'Rotation_type'] = self.scad_data.elements_table.loc[scad_index,
-                                                                                             'Rotation_type']
-            direction_series.loc[element] = self.scad_data.elements_table.loc[scad_index, 'Direction']
-
-        elements_table = pd.concat([elements_table, direction_series], axis=1)
+        elements = elements_table.index.values
+        element_centers = elements_table.loc[:, center_columns].values
+        reinforcement_centers = reinforcement_table.loc[:, center_columns].values
+        scad_centers = self.scad_data.elements_table.loc[:, center_columns].values
+
+        cache_folder = None
+        if use_cache and self.reinforcement_data.path is not None:
+            cache_folder = os.path.dirname(os.path.abspath(self.reinforcement_data.path))
+            fingerprint = self.mesh_fingerprint([elements, self.scad_data.elements_table.index.values],
+                                                [element_centers, reinforcement_centers, scad_centers])
+
+        cached_rows = None
+        if cache_folder is not None:
+            matches = model_cache.load_keyed(cache_folder, 'matches', self.matches_cache_version, fingerprint)
+            if matches is not None:
+                try:
+                    if np.array_equal(matches['elements'], elements):
+                        cached_rows = matches['reinforcement_rows'], matches['scad_rows']
+                except Exception:
+                    model_cache.discard_keyed(cache_folder, 'matches', self.matches_cache_version, fingerprint)
+
+        if cached_rows is not None:
+            reinforcement_rows, scad_rows = cached_rows
+        else:
+            reinforcement_rows = self.match_elements(elements, element_centers, reinforcement_centers, 'QM rows',
+                                                     engine)
+            scad_rows = self.match_elements(elements, element_centers, scad_centers, 'SCAD elements', engine)
+
+            if cache_folder is not None:
+                model_cache.store_keyed(cache_folder, 'matches', self.matches_cache_version, fingerprint,
+                                        {'elements': elements,
+                                         'reinforcement_rows': reinforcement_rows.astype(np.int32),
+                                         'scad_rows': scad_rows.astype(np.int32)})
+
+        for column in ['Top_X', 'Top_Y', 'Lat_X', 'Bot_X', 'Bot_Y', 'Lat_Y']:
+            elements_table[column] = reinforcement_table[column].values[reinforcement_rows]
+
+        for column in ['Rotation_code', 'Direction_id']:
+            elements_table[column] = self.scad_data.elements_table[column].values[scad_rows]
 
         self.elements_table = elements_table
         self.nodes_table = self.reinforcement_data.nodes_table
+        self.connectivity = self.reinforcement_data.connectivity
+        self.node_element_index = NodeElementIndex(self.connectivity)
 
         # self.reinforcement_data = None
         # self.scad_data = None
 
-    @Decorators.timed
-    def make_combined_table_test(self):
-        centers_table = self.calculate_element_centers(self.scad_data.elements_table.Nodes, self.scad_data.nodes_table)
-        self.scad_data.elements_table = pd.concat([self.scad_data.elements_table, centers_table], axis=1)
+    def mesh_fingerprint(self, element_ids: List[np.array], element_centers: List[np.array]) -> str:
+        """Hash of element ids and of element centers rounded to match tolerance"""
+        fingerprint = hashlib.sha1()
+        for ids in element_ids:
+            fingerprint.update(np.ascontiguousarray(ids, dtype=np.int64).tobytes())
+        for centers in element_centers:
+            rounded_centers = np.round(np.asarray(centers, dtype=float) / self.match_tolerance).astype(np.int64)
+            fingerprint.update(rounded_centers.tobytes())
 
-        scad_index = self.scad_data.elements_table.sort_values(by=['Element_center_X',
-                                                                   'Element_center_Y',
-                                                                   'Element_center_Z']).index
-        reinforcement_index = self.reinforcement_data.reinforcement_table.sort_values(by=['Element_center_X',
-                                                                                          'Element_center_Y',
-                                                                                          'Element_center_Z']).index
-        asf_index = self.reinforcement_data.elements_table.sort_values(by=['Element_center_X',
-                                                                           'Element_center_Y',
-                                                                           'Element_center_Z']).index
-
-        asf_columns = self.reinforcement_data.elements_table.columns
-        # scad_columns = self.scad_data.elements_table.columns
-        scad_columns = ['Rotation_type', 'Direction']
-        reinforcement_columns = [column for column in self.reinforcement_data.reinforcement_table.columns
-                                 if column not in asf_columns]
-
-        self.elements_table = pd.concat(
-            [
-                self.reinforcement_data.elements_table.loc[asf_index].reset_index(drop=True),
-                self.reinforcement_data.reinforcement_table.loc[reinforcement_index,
-                                                                reinforcement_columns].reset_index(drop=True),
-                self.scad_data.elements_table.loc[scad_index, scad_columns].reset_index(drop=True),
-            ], axis=1)
-
-        # self.nodes_table = self.scad_data.nodes_table
-        self.nodes_table = self.reinforcement_data.nodes_table
+        return fingerprint.hexdigest()
 
-        # self.reinforcement_data = None
-        # self.scad_data = None
+    def match_elements(self, elements: np.array, element_centers: np.array, reference_centers: np.array, name: str,
+                       engine: str = 'sorted') -> np.array:
+        """Rows of reference_centers matching element_centers"""
+        if engine == 'sorted':
+            matches = MeshTools.align_sorted_points(element_centers, reference_centers, self.match_tolerance)
+            if matches is not None:
+                return matches
+
+        matches = MeshTools.match_points(element_centers, reference_centers, self.match_tolerance)
+        self.check_element_matches(elements, matches, name)
+
+        return matches
+
+    @staticmethod
+    def check_element_matches(elements: np.array, matches: np.array, name: str, max_listed: int = 10) -> None:
+        for code, problem in [(-1, 'no matching'), (-2, 'several matching')]:
+            failed = elements[matches == code]
+            listed = ', '.join(map(str, failed[:max_listed])) + (', ...' if len(failed) > max_listed else '')
+            assert len(failed) == 0, f'{len(failed)} elements have {problem} {name}: {listed}'
 
     @staticmethod
     def make_rotation_matrix_2d(x, y) -> np.array:
@@ -299,17 +385,16 @@ class ReinforcementScheme:
                                                                 self.background_reinforcement['step'])
 
     @Decorators.timed
-    def calculate_element_centers(self, element_nodes: pd.Series, nodes_table: pd.DataFrame) -> pd.DataFrame:
-        element_centers = list(map(self.calculate_single_element_center,
-                                   element_nodes.values,
-                                   [nodes_table] * len(element_nodes.values)))
+    def calculate_element_centers(self, element_nodes: Union[Connectivity, pd.Series],
+                                  nodes_table: pd.DataFrame) -> pd.DataFrame:
+        if isinstance(element_nodes, pd.Series):
+            element_nodes = Connectivity.from_lists(element_nodes.index.values, element_nodes.values)
+
+        element_centers = MeshTools.element_centers(element_nodes,
+                                                    nodes_table.index.values,
+                                                    nodes_table.loc[:, ['X', 'Y', 'Z']].values)
 
-        centers_table = pd.DataFrame(data=element_centers, index=element_nodes.index,
+        centers_table = pd.DataFrame(data=element_centers, index=element_nodes.elements,
                                      columns=('Element_center_X', 'Element_center_Y', 'Element_center_Z',))
 
         return centers_table
-
-    @staticmethod
-    def calculate_single_element_center(nodes, nodes_table):
-        coordinates = nodes_table.loc[nodes, ['X', 'Y', 'Z']].values.astype(float)
-        return np.mean(coordinates, axis=0)
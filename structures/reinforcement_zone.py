@@ -1,36 +1,374 @@
-from typing import Iterable, Optional
+from typing import Iterable, List, Optional, Sequence
 from utils.reinforcement_calculator import ReinforcementCalculator
+from utils.mesh_tools import Connectivity, MeshTools
+import pandas as pd
 import numpy as np
 
 
-class ReinforcementZone:
-    def __init__(self, calculator: Optional[ReinforcementCalculator] = None):
-        self.elements = np.array([])
-        self.nodes = np.array([])
-        self.reinforcement_direction_vector = [0, 0, 0]
-        self.reinforcement_direction = None
-        self.bounding_rectangle = None
-        self.max_intensity = None
-        self.background_reinforcement_intensity = None
+class ZoneSet:
+    """Reinforcement zones of one location as arrays: elements and nodes of zones in CSR form, direction, bounding
+    rectangle, max intensity and chosen additional reinforcement of every zone. Calculator, background reinforcement
+    and anchorage lengths are shared by all zones. Zones are accessed as ReinforcementZone views.
+    Derived values of a zone are kept until the set_* methods change its inputs"""
+    zone_arrays = ('direction_vectors', 'reinforcement_directions', 'bounding_rectangles', 'max_intensities',
+                   'additional_diameters', 'additional_steps', 'dimensions', 'midpoints', 'dimensions_adjusted',
+                   'bounding_rectangles_adjusted')
+
+    def __init__(self, element_offsets: np.array = (0,), elements: np.array = (), node_offsets: np.array = (0,),
+                 nodes: np.array = (), calculator: Optional[ReinforcementCalculator] = None):
+        self.element_offsets = np.asarray(element_offsets, dtype=np.int64)
+        self.elements = np.asarray(elements, dtype=np.int64)
+        self.node_offsets = np.asarray(node_offsets, dtype=np.int64)
+        self.nodes = np.asarray(nodes, dtype=np.int64)
+        assert len(self.element_offsets) == len(self.node_offsets), 'Element and node offsets of different zones'
+
+        zones_count = len(self.element_offsets) - 1
+        self.direction_vectors = np.zeros((zones_count, 3))
+        self.reinforcement_directions = np.full(zones_count, None, dtype=object)
+        self.bounding_rectangles = np.full((zones_count, 4, 2), np.nan)
+        self.max_intensities = np.full(zones_count, np.nan)
+        self.additional_diameters = np.zeros(zones_count, dtype=np.int64)
+        self.additional_steps = np.zeros(zones_count, dtype=np.int64)
+        self.dimensions = np.full((zones_count, 2), np.nan)
+        self.midpoints = np.full((zones_count, 2), np.nan)
+        self.dimensions_adjusted = np.full((zones_count, 2), np.nan)
+        self.bounding_rectangles_adjusted = np.full((zones_count, 4, 2), np.nan)
+        self.hulls = [None] * zones_count
+        self.builders = {}
+
+        self.calculator = calculator if calculator else ReinforcementCalculator()
         self.background_reinforcement = None
+        self.background_reinforcement_intensity = None
         self.anchorage_lengths = None
-        self.calculator = calculator if calculator else ReinforcementCalculator()
 
-    def add_one_element_to_zone(self, element: int, nodes: Iterable):
-        if element not in self.elements:
-            self.elements = np.append(self.elements, element)
+    def __len__(self) -> int:
+        return len(self.element_offsets) - 1
+
+    def __getitem__(self, index: int) -> 'ReinforcementZone':
+        if not -len(self) <= index < len(self):
+            raise IndexError('Zone index out of range')
+
+        return ReinforcementZone(zone_set=self, index=index % len(self))
+
+    def __iter__(self):
+        return (ReinforcementZone(zone_set=self, index=index) for index in range(len(self)))
+
+    @property
+    def element_zones(self) -> np.array:
+        """Zone of every element of elements"""
+        return np.repeat(np.arange(len(self)), np.diff(self.element_offsets))
+
+    def zone_elements(self, index: int) -> np.array:
+        return self.elements[self.element_offsets[index]:self.element_offsets[index + 1]]
+
+    def zone_nodes(self, index: int) -> np.array:
+        return self.nodes[self.node_offsets[index]:self.node_offsets[index + 1]]
+
+    @staticmethod
+    def from_groups(elements: np.array, groups: np.array, connectivity: Connectivity,
+                    calculator: Optional[ReinforcementCalculator] = None) -> 'ZoneSet':
+        """Zone for every group of elements in order of group labels, with sorted unique elements and nodes"""
+        elements = np.asarray(elements, dtype=np.int64)
+        groups = np.asarray(groups)
+
+        order = np.lexsort((elements, groups))
+        elements, groups = elements[order], groups[order]
+        first = np.concatenate(([True], (np.diff(groups) != 0) | (np.diff(elements) != 0)))[:len(elements)]
+        elements, groups = elements[first], groups[first]
+
+        zone_ids = np.cumsum(np.concatenate(([True], np.diff(groups) != 0))[:len(groups)]) - 1
+        zones_count = zone_ids[-1] + 1 if len(zone_ids) else 0
+
+        nodes = connectivity.nodes_of(elements)
+        node_zones = np.repeat(zone_ids, connectivity.lengths[connectivity.positions(elements)])
+        nodes, node_zones = nodes[nodes != 0], node_zones[nodes != 0]
+
+        order = np.lexsort((nodes, node_zones))
+        nodes, node_zones = nodes[order], node_zones[order]
+        first = np.concatenate(([True], (np.diff(node_zones) != 0) | (np.diff(nodes) != 0)))[:len(nodes)]
+        nodes, node_zones = nodes[first], node_zones[first]
+
+        element_offsets = np.concatenate(([0], np.cumsum(np.bincount(zone_ids, minlength=zones_count))))
+        node_offsets = np.concatenate(([0], np.cumsum(np.bincount(node_zones, minlength=zones_count))))
+
+        return ZoneSet(element_offsets, elements, node_offsets, nodes, calculator)
+
+    def take(self, indices: Sequence[int]) -> 'ZoneSet':
+        """Zone set of zones at indices, sharing calculator, background reinforcement and anchorage lengths"""
+        indices = np.asarray(indices, dtype=np.int64)
+
+        def take_csr(offsets, values):
+            lengths = offsets[indices + 1] - offsets[indices]
+            new_offsets = np.concatenate(([0], np.cumsum(lengths)))
+            slots = np.repeat(offsets[indices] - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+            return new_offsets, values[slots]
+
+        zone_set = ZoneSet(*take_csr(self.element_offsets, self.elements), *take_csr(self.node_offsets, self.nodes),
+                           self.calculator)
+        for name in self.zone_arrays:
+            setattr(zone_set, name, getattr(self, name)[indices])
+        zone_set.hulls = [self.hulls[index] for index in indices]
+        zone_set.share_settings(self)
+
+        return zone_set
+
+    @staticmethod
+    def concatenate(zone_sets: List['ZoneSet']) -> 'ZoneSet':
+        """Zones of all zone sets in order, sharing settings of the first zone set"""
+        def concatenate_csr(offsets, values):
+            shifts = np.cumsum([0] + [offset[-1] for offset in offsets[:-1]])
+            return (np.concatenate([[0]] + [offset[1:] + shift for offset, shift in zip(offsets, shifts)]),
+                    np.concatenate([np.asarray(value, dtype=np.int64) for value in values]))
+
+        zone_set = ZoneSet(*concatenate_csr([zones.element_offsets for zones in zone_sets],
+                                            [zones.elements for zones in zone_sets]),
+                           *concatenate_csr([zones.node_offsets for zones in zone_sets],
+                                            [zones.nodes for zones in zone_sets]),
+                           zone_sets[0].calculator)
+        for name in ZoneSet.zone_arrays:
+            setattr(zone_set, name, np.concatenate([getattr(zones, name) for zones in zone_sets]))
+        zone_set.hulls = [hull for zones in zone_sets for hull in zones.hulls]
+        zone_set.share_settings(zone_sets[0])
+
+        return zone_set
+
+    def share_settings(self, zone_set: 'ZoneSet'):
+        self.background_reinforcement = zone_set.background_reinforcement
+        self.background_reinforcement_intensity = zone_set.background_reinforcement_intensity
+        self.anchorage_lengths = zone_set.anchorage_lengths
+
+    def set_zone_elements(self, index: int, elements: np.array, nodes: np.array):
+        """Replace elements and nodes of a zone"""
+        for offsets_name, values_name, values in [('element_offsets', 'elements', elements),
+                                                  ('node_offsets', 'nodes', nodes)]:
+            offsets = getattr(self, offsets_name)
+            start, end = offsets[index], offsets[index + 1]
+            setattr(self, values_name, np.concatenate((getattr(self, values_name)[:start],
+                                                       np.asarray(values, dtype=np.int64),
+                                                       getattr(self, values_name)[end:])))
+            offsets[index + 1:] += len(values) - (end - start)
+
+    def set_direction_vectors(self, indices, vectors: np.array):
+        self.direction_vectors[indices] = vectors
+        self.reset_derived(indices, reinforcement=False)
+
+    def set_reinforcement_directions(self, indices, directions):
+        self.reinforcement_directions[indices] = directions
+        self.reset_derived(indices, reinforcement=False)
+
+    def set_bounding_rectangles(self, indices, rectangles: np.array):
+        self.bounding_rectangles[indices] = rectangles
+        self.reset_derived(indices, reinforcement=False)
+
+    def set_max_intensities(self, indices, max_intensities: np.array):
+        self.max_intensities[indices] = max_intensities
+        self.reset_derived(indices)
+
+    def set_background_reinforcement(self, reinforcement: Optional[dict], intensity: Optional[float]):
+        self.background_reinforcement = reinforcement
+        self.background_reinforcement_intensity = intensity
+        self.reset_derived()
+
+    def set_anchorage_lengths(self, anchorage_lengths: Optional[pd.DataFrame]):
+        self.anchorage_lengths = anchorage_lengths
+        self.reset_derived(reinforcement=False)
+
+    def reset_derived(self, indices=slice(None), reinforcement: bool = True):
+        """Forget dimensions, midpoints and adjusted rectangles of zones, and additional reinforcement unless only
+        their geometry changed"""
+        if reinforcement:
+            self.additional_diameters[indices] = 0
+            self.additional_steps[indices] = 0
+
+        for name in ['dimensions', 'midpoints', 'dimensions_adjusted', 'bounding_rectangles_adjusted']:
+            getattr(self, name)[indices] = np.nan
+
+
+class ZoneBuilder:
+    """Elements and nodes of a growing zone in buffers doubled when full, with membership bitmaps over element and node
+    ids so that every id is stored once. Finalized once into sorted arrays"""
+    def __init__(self, capacity: int = 64):
+        self.elements = np.empty(capacity, dtype=np.int64)
+        self.nodes = np.empty(capacity, dtype=np.int64)
+        self.elements_count = 0
+        self.nodes_count = 0
+        self.element_bitmap = np.zeros(capacity, dtype=bool)
+        self.node_bitmap = np.zeros(capacity, dtype=bool)
+
+    def __contains__(self, element: int) -> bool:
+        return 0 <= element < len(self.element_bitmap) and bool(self.element_bitmap[element])
+
+    def __len__(self) -> int:
+        return self.elements_count
+
+    def add(self, elements: Iterable, nodes: Iterable):
+        nodes = np.asarray(nodes, dtype=np.int64).ravel()
+        self.element_bitmap, self.elements, self.elements_count = self.append_new(
+            self.element_bitmap, self.elements, self.elements_count, elements)
+        self.node_bitmap, self.nodes, self.nodes_count = self.append_new(
+            self.node_bitmap, self.nodes, self.nodes_count, nodes[nodes != 0])
+
+    @staticmethod
+    def append_new(bitmap: np.array, buffer: np.array, count: int, ids: Iterable) -> (np.array, np.array, int):
+        """Append ids missing from bitmap to buffer, growing bitmap and buffer geometrically"""
+        ids = np.asarray(ids, dtype=np.int64).ravel()
+        if len(ids) == 0:
+            return bitmap, buffer, count
+        assert ids.min() >= 0, 'Negative id in zone'
+
+        if ids.max() >= len(bitmap):
+            bitmap = np.concatenate((bitmap, np.zeros(max(ids.max() + 1, 2 * len(bitmap)) - len(bitmap), dtype=bool)))
+
+        new_ids = np.unique(ids[~bitmap[ids]])
+        bitmap[new_ids] = True
+
+        if count + len(new_ids) > len(buffer):
+            buffer = np.concatenate((buffer[:count], np.empty(max(count + len(new_ids), 2 * len(buffer)) - count,
+                                                              dtype=np.int64)))
+        buffer[count:count + len(new_ids)] = new_ids
+
+        return bitmap, buffer, count + len(new_ids)
+
+    def finalize(self) -> (np.array, np.array):
+        """Sorted elements and nodes"""
+        return np.sort(self.elements[:self.elements_count]), np.sort(self.nodes[:self.nodes_count])
+
+
+class ReinforcementZone:
+    """View of one zone of a ZoneSet. A zone created without a zone set owns a zone set of one empty zone"""
+    def __init__(self, calculator: Optional[ReinforcementCalculator] = None, zone_set: Optional[ZoneSet] = None,
+                 index: int = 0):
+        self.zone_set = zone_set if zone_set is not None else ZoneSet((0, 0), (), (0, 0), (), calculator)
+        self.index = index
+
+    @property
+    def elements(self) -> np.array:
+        return self.zone_set.zone_elements(self.index)
+
+    @property
+    def nodes(self) -> np.array:
+        return self.zone_set.zone_nodes(self.index)
+
+    @property
+    def hull(self) -> Optional[np.array]:
+        return self.zone_set.hulls[self.index]
+
+    @hull.setter
+    def hull(self, hull: Optional[np.array]):
+        self.zone_set.hulls[self.index] = hull
 
-            nodes = [node for node in nodes if node != 0]
-            self.nodes = np.union1d(self.nodes, nodes)
+    @property
+    def reinforcement_direction_vector(self) -> list:
+        return self.zone_set.direction_vectors[self.index].tolist()
 
-    def add_multiple_elements_to_zone(self, elements: Iterable, nodes: Iterable):
-        self.elements = np.union1d(self.elements, elements)
+    @reinforcement_direction_vector.setter
+    def reinforcement_direction_vector(self, vector: Iterable):
+        self.zone_set.set_direction_vectors(self.index, vector)
+
+    @property
+    def reinforcement_direction(self) -> Optional[str]:
+        return self.zone_set.reinforcement_directions[self.index]
+
+    @reinforcement_direction.setter
+    def reinforcement_direction(self, direction: Optional[str]):
+        self.zone_set.set_reinforcement_directions(self.index, direction)
+
+    @property
+    def bounding_rectangle(self) -> Optional[np.array]:
+        rectangle = self.zone_set.bounding_rectangles[self.index]
+        return None if np.isnan(rectangle).all() else rectangle
+
+    @bounding_rectangle.setter
+    def bounding_rectangle(self, points: Optional[np.array]):
+        self.zone_set.set_bounding_rectangles(self.index, np.nan if points is None else points)
+
+    @property
+    def max_intensity(self) -> Optional[float]:
+        max_intensity = self.zone_set.max_intensities[self.index]
+        return None if np.isnan(max_intensity) else max_intensity
+
+    @max_intensity.setter
+    def max_intensity(self, max_intensity: Optional[float]):
+        self.zone_set.set_max_intensities(self.index, np.nan if max_intensity is None else max_intensity)
+
+    @property
+    def background_reinforcement(self) -> Optional[dict]:
+        return self.zone_set.background_reinforcement
 
-        nodes = [node for node in nodes if node != 0]
-        self.nodes = np.union1d(self.nodes, nodes)
+    @background_reinforcement.setter
+    def background_reinforcement(self, reinforcement: Optional[dict]):
+        self.zone_set.set_background_reinforcement(reinforcement, self.background_reinforcement_intensity)
+
+    @property
+    def background_reinforcement_intensity(self) -> Optional[float]:
+        return self.zone_set.background_reinforcement_intensity
+
+    @background_reinforcement_intensity.setter
+    def background_reinforcement_intensity(self, intensity: Optional[float]):
+        self.zone_set.set_background_reinforcement(self.background_reinforcement, intensity)
+
+    @property
+    def anchorage_lengths(self) -> Optional[pd.DataFrame]:
+        return self.zone_set.anchorage_lengths
+
+    @anchorage_lengths.setter
+    def anchorage_lengths(self, anchorage_lengths: Optional[pd.DataFrame]):
+        self.zone_set.set_anchorage_lengths(anchorage_lengths)
+
+    @property
+    def calculator(self) -> ReinforcementCalculator:
+        return self.zone_set.calculator
+
+    @property
+    def builder(self) -> Optional[ZoneBuilder]:
+        return self.zone_set.builders.get(self.index)
+
+    def start_building(self):
+        """Collect added elements and nodes in a ZoneBuilder until finish_building writes them to the zone set"""
+        if self.builder is None:
+            builder = ZoneBuilder()
+            builder.add(self.elements, self.nodes)
+            self.zone_set.builders[self.index] = builder
+
+    def finish_building(self):
+        builder = self.zone_set.builders.pop(self.index, None)
+        if builder is not None:
+            self.zone_set.set_zone_elements(self.index, *builder.finalize())
+
+    def add_one_element_to_zone(self, element: int, nodes: Iterable, coordinates: Optional[np.array] = None):
+        if self.builder is not None:
+            if element not in self.builder:
+                self.add_multiple_elements_to_zone([element], nodes, coordinates)
+            return
+
+        elements = self.elements
+        position = np.searchsorted(elements, element)
+        if position == len(elements) or elements[position] != element:
+            self.add_multiple_elements_to_zone([element], nodes, coordinates)
+
+    def add_multiple_elements_to_zone(self, elements: Iterable, nodes: Iterable,
+                                      coordinates: Optional[np.array] = None):
+        self.merge_hull(coordinates)
+
+        if self.builder is not None:
+            self.builder.add(elements, nodes)
+            return
+
+        nodes = np.asarray(nodes, dtype=np.int64).ravel()
+        self.zone_set.set_zone_elements(self.index, np.union1d(self.elements, np.asarray(elements, dtype=np.int64)),
+                                        np.union1d(self.nodes, nodes[nodes != 0]))
+
+    def merge_hull(self, coordinates: Optional[np.array]):
+        """Merge XY coordinates of added nodes into the convex hull of the zone,
+        forget the hull when they are unknown"""
+        if coordinates is None:
+            self.hull = None
+        elif self.hull is not None or len(self.elements if self.builder is None else self.builder) == 0:
+            points = np.asarray(coordinates, dtype=float)[:, :2]
+            self.hull = MeshTools.convex_hull(points if self.hull is None else np.vstack((self.hull, points)))
 
     def set_reinforcement_direction(self, x: float, y: float, z: float):
-        self.reinforcement_direction_vector[0:3] = x, y, z
+        self.reinforcement_direction_vector = x, y, z
 
     def set_bounding_rectangle(self, points: Iterable):
         points = np.array(points)
@@ -44,8 +382,19 @@ class ReinforcementZone:
         else:
             raise ValueError('Bounding rectangle points array is not 2d')
 
+    def cached(self, name: str, calculate) -> np.array:
+        """Derived value of the zone from zone set array name, calculated when it is not known"""
+        values = getattr(self.zone_set, name)
+        if np.isnan(values[self.index]).any():
+            values[self.index] = calculate()
+
+        return values[self.index]
+
     @property
-    def dimensions(self):
+    def dimensions(self) -> tuple:
+        return tuple(self.cached('dimensions', self.calculate_dimensions))
+
+    def calculate_dimensions(self) -> tuple:
         rotation_matrix = self.make_rotation_matrix_2d(*self.reinforcement_direction_vector[:2])
         points = (np.linalg.inv(rotation_matrix) @ self.bounding_rectangle.T).T
         x_dim = abs(points[:, 0].max() - points[:, 0].min())
@@ -55,6 +404,17 @@ class ReinforcementZone:
 
     @property
     def additional_reinforcement(self) -> dict:
+        """Additional reinforcement of minimal intensity, chosen once and kept in the zone set until max intensity or
+        background reinforcement change"""
+        if self.zone_set.additional_steps[self.index] == 0:
+            additional_reinforcement = self.choose_additional_reinforcement()
+            self.zone_set.additional_diameters[self.index] = additional_reinforcement['diameter']
+            self.zone_set.additional_steps[self.index] = additional_reinforcement['step']
+
+        return {'diameter': int(self.zone_set.additional_diameters[self.index]),
+                'step': int(self.zone_set.additional_steps[self.index])}
+
+    def choose_additional_reinforcement(self) -> dict:
         additional_intensity = self.max_intensity - self.background_reinforcement_intensity
         additional_reinforcement_dict = {}
 
@@ -79,10 +439,16 @@ class ReinforcementZone:
 
     @property
     def midpoint(self) -> tuple:
+        return tuple(self.cached('midpoints', self.calculate_midpoint))
+
+    def calculate_midpoint(self) -> tuple:
         return np.average(self.bounding_rectangle[:, 0]), np.average(self.bounding_rectangle[:, 1])
 
     @property
     def dimensions_adjusted(self) -> tuple:
+        return tuple(self.cached('dimensions_adjusted', self.calculate_dimensions_adjusted))
+
+    def calculate_dimensions_adjusted(self) -> tuple:
         diameter, step = [self.additional_reinforcement[value] for value in ['diameter', 'step']]
         x_m, y_m = self.dimensions
         x_mm, y_mm = x_m * 1000, y_m * 1000
@@ -108,6 +474,9 @@ class ReinforcementZone:
 
     @property
     def bounding_rectangle_adjusted(self) -> np.array:
+        return self.cached('bounding_rectangles_adjusted', self.calculate_bounding_rectangle_adjusted)
+
+    def calculate_bounding_rectangle_adjusted(self) -> np.array:
         scale = [self.dimensions_adjusted[i] / self.dimensions[i] for i in range(2)]
 
         rotation_matrix = self.make_rotation_matrix_2d(*self.reinforcement_direction_vector[:2])
@@ -1,30 +1,59 @@
 import numpy as np
 
 from utils.scad_data import SCADData
-from utils.reinforcement_data import ReinforcementData
+from utils.reinforcement_data import ReinforcementData, MappedReinforcementData
+from utils.model_cache import ModelCache, model_cache
+from utils.mesh_tools import Connectivity, MeshTools, NodeElementIndex
 from structures.reinforcement_scheme import ReinforcementScheme
 import unittest
+import tempfile
+import os
 import pandas as pd
 
 
 class ImportTest(unittest.TestCase):
     def test_import_elements_from_txt(self):
         data = '(1/2 15 3 10/ r 1 5: 0 0 1 1/ 51 21 12/ 31 2 34 35 40 41 22 23 28 29/ 21 1 11 14 18 19/ 12 1 12 15 27/)'
-        element_table = SCADData().import_elements_from_txt_data(data)
+        element_table, connectivity = SCADData().import_elements_from_txt_data(data)
 
         self.assertEqual(len(element_table), 10)
         self.assertEqual(element_table.Element_type.to_list(), [2, 2, 2, 2, 2, 2, 51, 31, 21, 12])
         self.assertEqual(element_table.Stiffness.to_list(), [15, 15, 15, 15, 15, 15, 21, 2, 1, 1])
-        self.assertEqual(element_table.loc[1, 'Nodes'], [3, 10])
-        self.assertEqual(element_table.loc[2, 'Nodes'], [4, 11])
-        self.assertEqual(element_table.loc[3, 'Nodes'], [5, 12])
-        self.assertEqual(element_table.loc[4, 'Nodes'], [6, 13])
-        self.assertEqual(element_table.loc[5, 'Nodes'], [7, 14])
-        self.assertEqual(element_table.loc[6, 'Nodes'], [8, 15])
-        self.assertEqual(element_table.loc[7, 'Nodes'], [12])
-        self.assertEqual(element_table.loc[8, 'Nodes'], [34, 35, 40, 41, 22, 23, 28, 29])
-        self.assertEqual(element_table.loc[9, 'Nodes'], [11, 14, 18, 19])
-        self.assertEqual(element_table.loc[10, 'Nodes'], [12, 15, 27])
+        self.assertEqual(connectivity.element_nodes(1).tolist(), [3, 10])
+        self.assertEqual(connectivity.element_nodes(2).tolist(), [4, 11])
+        self.assertEqual(connectivity.element_nodes(3).tolist(), [5, 12])
+        self.assertEqual(connectivity.element_nodes(4).tolist(), [6, 13])
+        self.assertEqual(connectivity.element_nodes(5).tolist(), [7, 14])
+        self.assertEqual(connectivity.element_nodes(6).tolist(), [8, 15])
+        self.assertEqual(connectivity.element_nodes(7).tolist(), [12])
+        self.assertEqual(connectivity.element_nodes(8).tolist(), [34, 35, 40, 41, 22, 23, 28, 29])
+        self.assertEqual(connectivity.element_nodes(9).tolist(), [11, 14, 18, 19])
+        self.assertEqual(connectivity.element_nodes(10).tolist(), [12, 15, 27])
+
+    def test_check_node_references(self):
+        scad_data = SCADData()
+        scad_data.nodes_table = pd.DataFrame(index=[1, 2, 3], data=np.zeros((3, 3)), columns=('X', 'Y', 'Z'))
+        scad_data.connectivity = Connectivity.from_lists(np.array([1, 2]), [[1, 2, 3], [5, 3, 4, 5]])
+
+        with self.assertRaisesRegex(AssertionError, 'Nodes 4, 5 not in Nodes table'):
+            scad_data.check_node_references()
+
+    def test_import_group_elements_from_txt(self):
+        document = '2 15 3 10/ r 1 5: 0 0 1 1/ 51 21 12/ 31 2 34 35 40 41 22 23 28 29/ 21 1 11 14 18 19/'
+        element_table, connectivity = SCADData().parse_elements_document(document, np.array([9, 4, 5]))
+
+        self.assertEqual(element_table.index.tolist(), [4, 5, 9])
+        self.assertEqual(element_table.Element_type.to_list(), [2, 2, 21])
+        self.assertEqual(connectivity.element_nodes(4).tolist(), [6, 13])
+        self.assertEqual(connectivity.element_nodes(9).tolist(), [11, 14, 18, 19])
+
+        records, numbers = SCADData.select_record_chains(document.split('/')[:-1], np.array([8]))
+        self.assertEqual(len(records), 1)
+        self.assertEqual(numbers.tolist(), [8])
+
+        nodes_table = SCADData().parse_nodes_document('0 0/r 1 2: 1/5 5 5/', np.array([3, 4]))
+        self.assertEqual(nodes_table.index.tolist(), [3, 4])
+        self.assertEqual(nodes_table.X.tolist(), [2, 5])
 
     def test_get_elements_from_txt(self):
         with self.subTest(msg='Testcase 1'):
@@ -47,6 +76,13 @@ class ImportTest(unittest.TestCase):
             result = [1, 2, 3, 4, 5, 6, 9, 12, 13, 14]
             self.assertEqual(SCADData.get_element_list_from_string(string), result)
 
+        with self.subTest(msg='Ranges'):
+            string = '1-5 6 r 12 3\n 13 - 14'
+            result = [[1, 6, 1], [6, 13, 3], [13, 15, 1]]
+            self.assertEqual(SCADData.get_element_ranges_from_string(string).tolist(), result)
+            self.assertEqual(SCADData.get_element_ranges_from_string(' ').shape, (0, 3))
+            self.assertRaises(AssertionError, SCADData.get_element_ranges_from_string, '1-5 x')
+
     def test_get_nodes_from_txt(self):
         with self.subTest(msg='Testcase 1'):
             string = '(4/1.5 2.8/ 2.3 3.7 8.8/ 5/r 1 5: 0 0 2/)'
@@ -58,6 +94,44 @@ class ImportTest(unittest.TestCase):
             self.assertEqual(nodes_table.Y.tolist(), [2.8, 3.7, 0, 0, 0, 0, 0, 0])
             self.assertEqual(nodes_table.Z.tolist(), [0, 8.8, 0, 2, 4, 6, 8, 10])
 
+        with self.subTest(msg='Testcase 2'):
+            string = '(4/0 0/r 1 2: 1/r 1 2:0 0.5/\n 3 3 3/)'
+            nodes_table = SCADData().import_nodes_form_txt_data(string)
+
+            self.assertEqual(nodes_table.index.tolist(), list(range(1, 7)))
+            self.assertEqual(nodes_table.X.tolist(), [0, 1, 2, 2, 2, 3])
+            self.assertEqual(nodes_table.Y.tolist(), [0, 0, 0, 0.5, 1, 3])
+            self.assertEqual(nodes_table.Z.tolist(), [0, 0, 0, 0, 0, 3])
+
+    def test_split_documents(self):
+        string = '(0;1;"Test (1/";/\n23;A=1\nB=2 /)\n(1/44  1 1\n 2 3 4/)\n(53/Name="A  b" 1 : 2-3/\n)'
+
+        with self.subTest(msg='All documents'):
+            documents = SCADData.split_documents(string)
+            self.assertEqual(sorted(documents.keys()), [0, 1, 53])
+            self.assertEqual(documents[1], '44 1 1 2 3 4/')
+            self.assertEqual(documents[53], 'Name="A  b" 1 : 2-3/ ')
+
+        with self.subTest(msg='Selected documents'):
+            self.assertEqual(list(SCADData.split_documents(string, (1,)).keys()), [1])
+            self.assertRaises(AssertionError, SCADData.split_documents, string, (4,))
+
+        with self.subTest(msg='Unterminated documents'):
+            documents = SCADData.split_documents('(1/44 1 1/)\n(61/12 34 ' + '1 2 3; ' * 30000 + '"')
+            self.assertEqual(list(documents.keys()), [1])
+            documents = SCADData.split_documents('(61/ 0; 0/\n(1/44 1 1/)\n(4/"a/)')
+            self.assertEqual(list(documents.keys()), [61])
+
+    def test_import_force_directions(self):
+        string = '(33/\nEX  0 1 0  GroupElem=2 :1-3/\nEY  1 0 0  GroupElem=2 :4 r 8 2/\nEX  0 1 0 :9/\n)'
+        force_direction_table, directions = SCADData().import_force_directions_from_txt_data(string)
+
+        self.assertEqual(directions.tolist(), [[0, 1, 0], [1, 0, 0]])
+        self.assertEqual(force_direction_table.index.tolist(), [1, 2, 3, 4, 6, 8, 9])
+        self.assertEqual(force_direction_table.Rotation_code.tolist(), [0, 0, 0, 1, 1, 1, 0])
+        self.assertEqual(force_direction_table.Direction_id.tolist(), [0, 0, 0, 1, 1, 1, 0])
+        self.assertEqual(force_direction_table.Direction_id.dtype, np.int32)
+
     def test_scad_repeat_line_operator(self):
         with self.subTest('Testcase 1'):
             string = 'r 1 5: 0 0 2'
@@ -90,6 +164,84 @@ class ImportTest(unittest.TestCase):
             self.assertEqual(centers.loc[0].Element_center_Y, 50)
             self.assertEqual(centers.loc[0].Element_center_Z, 0)
 
+    def test_mesh_element_centers(self):
+        nodes_index = np.array([10, 20, 30, 40])
+        nodes_coordinates = np.array([[0, 0, 0], [3, 0, 0], [3, 3, 0], [0, 3, 3]])
+
+        with self.subTest('Quad and triangle'):
+            connectivity = Connectivity.from_padded(np.array([1, 2]), np.array([[10, 20, 30, 40], [10, 20, 30, 0]]))
+            centers = MeshTools.element_centers(connectivity, nodes_index, nodes_coordinates)
+
+            self.assertEqual(connectivity.lengths.tolist(), [4, 3])
+            self.assertEqual(centers.tolist(), [[1.5, 1.5, 0.75], [2, 1, 0]])
+
+        with self.subTest('Missing node'):
+            connectivity = Connectivity.from_padded(np.array([1]), np.array([[10, 50, 0]]))
+
+            with self.assertRaisesRegex(AssertionError, 'Node 50'):
+                MeshTools.element_centers(connectivity, nodes_index, nodes_coordinates)
+
+    def test_match_points(self):
+        reference_points = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [1, 1.0005, 0]])
+        points = np.array([[1.0004, -0.0004, 0], [0, 0, 0], [5, 5, 5], [1, 1.0002, 0], [0, 0.002, 0]])
+
+        self.assertEqual(MeshTools.match_points(points, reference_points, 1e-3).tolist(), [1, 0, -1, -2, -1])
+        self.assertEqual(MeshTools.match_points(points, reference_points[:0]).tolist(), [-1] * 5)
+
+    def test_align_sorted_points(self):
+        reference_points = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0]])
+
+        with self.subTest(msg='Same points'):
+            points = reference_points[[2, 0, 3, 1]] + 2e-4
+            self.assertEqual(MeshTools.align_sorted_points(points, reference_points).tolist(), [2, 0, 3, 1])
+
+        with self.subTest(msg='Different points'):
+            self.assertIsNone(MeshTools.align_sorted_points(reference_points[:3], reference_points))
+            self.assertIsNone(MeshTools.align_sorted_points(reference_points + [0, 0, 0.01], reference_points))
+
+    def test_oriented_bounding_rectangles(self):
+        points = np.array([[0, 0], [2, 0], [2, 1], [0, 1], [0, 0], [1, 1], [0, 2]])
+        rectangles = MeshTools.oriented_bounding_rectangles(points, [4, 3], np.array([0, np.pi / 4]))
+
+        self.assertEqual(rectangles.shape, (2, 2, 4))
+        np.testing.assert_allclose(rectangles[0], [[0, 0, 2, 2], [0, 1, 1, 0]], atol=1e-12)
+        np.testing.assert_allclose(rectangles[1], [[0, -1, 0, 1], [0, 1, 2, 1]], atol=1e-12)
+
+    def test_convex_hull(self):
+        points = np.array([[x, y] for x in range(5) for y in range(3)])
+        self.assertEqual(MeshTools.convex_hull(points).tolist(), [[0, 0], [4, 0], [4, 2], [0, 2]])
+        self.assertEqual(MeshTools.convex_hull(points[:2]).tolist(), [[0, 0], [0, 1]])
+
+        rotation_matrix = np.array([[np.cos(0.3), -np.sin(0.3)], [np.sin(0.3), np.cos(0.3)]])
+        hull = MeshTools.convex_hull(points @ rotation_matrix.T)
+        self.assertAlmostEqual(MeshTools.minimum_area_rectangle_angle(hull), 0.3)
+        self.assertAlmostEqual(MeshTools.minimum_area_rectangle_angle(hull @ rotation_matrix.T @ rotation_matrix.T),
+                               0.9 - np.pi / 2)
+
+    def test_connectivity(self):
+        connectivity = Connectivity.from_lists(np.array([5, 6, 7]), [[1, 2], [2, 3, 4, 5, 6, 7, 8, 9], [12]])
+
+        self.assertEqual(connectivity.element_nodes(6).tolist(), [2, 3, 4, 5, 6, 7, 8, 9])
+        self.assertEqual(connectivity.nodes_of([7, 5]).tolist(), [12, 1, 2])
+        self.assertEqual(connectivity.elements_with_nodes([2, 12]).tolist(), [5, 6, 7])
+        self.assertEqual(connectivity.dangling_nodes(np.arange(1, 9)).tolist(), [9, 12])
+        self.assertEqual(connectivity.connected_components([7, 6, 5]).tolist(), [0, 1, 1])
+        self.assertEqual(connectivity.connected_components([]).tolist(), [])
+
+        node_element_index = NodeElementIndex(connectivity)
+        self.assertEqual(node_element_index.nodes.tolist(), [1, 2, 3, 4, 5, 6, 7, 8, 9, 12])
+        self.assertEqual(node_element_index.node_elements(2).tolist(), [5, 6])
+        self.assertEqual(node_element_index.elements_with_nodes([2, 12, 40]).tolist(), [5, 6, 7])
+        self.assertEqual(node_element_index.connected_components([7, 5, 6]).tolist(), [0, 1, 1])
+        self.assertEqual(connectivity.padded().tolist(), [[1, 2, 0, 0, 0, 0, 0, 0],
+                                                          [2, 3, 4, 5, 6, 7, 8, 9],
+                                                          [12, 0, 0, 0, 0, 0, 0, 0]])
+
+        subset = connectivity.subset([7, 5])
+        self.assertEqual(subset.elements.tolist(), [7, 5])
+        self.assertEqual(subset.offsets.tolist(), [0, 1, 3])
+        self.assertEqual(subset.element_nodes(5).tolist(), [1, 2])
+
     def test_import_polygons(self):
         data = 'GL POLY 4\n   1.313   8.849   9.990\n   0.713   8.849   9.990\n   0.713   6.949   9.990\n   1.313   ' \
                '6.949   9.990\nGL POLY 4\n   0.963   4.769   9.990\n   0.713   4.769   9.990\n   0.713   4.369   ' \
@@ -112,6 +264,134 @@ class ImportTest(unittest.TestCase):
                 with self.subTest(f'{n=}, {k=}'):
                     self.assertCountEqual(ReinforcementData.import_polygons(data)[n][k], expected_result[n][k])
 
+    def test_index_sections(self):
+        data = b'1.0 Nemetschek ALLPLAN\nasf\nGL POLY 2\n   0.000   0.000   0.000\n   1.000   0.000   0.000\n' \
+               b'GP KNOT 1\n    1   0.000   0.000   0.000\nGF ELEM 1\n    1    1    2    3    0\n' \
+               b'QR  1  202510   0.000   0.000   0.000   0.000  90.000\n' \
+               b'QM  0 0   0.250   0.250   0.000    0.39    0.39    0.00    0.02    0.02    0.00\n' \
+               b'QM  0 0   0.250   0.750   0.000    0.43    0.87    0.00    0.17    0.00    0.00\n'
+        sections = ReinforcementData.index_sections(data)
+
+        self.assertEqual(len(sections['GL POLY']), 1)
+        self.assertEqual(len(data[slice(*sections['GL POLY'][0])].splitlines()), 2)
+        self.assertEqual(data[slice(*sections['GP KNOT'][0])], b'    1   0.000   0.000   0.000')
+        self.assertEqual(data[slice(*sections['GF ELEM'][0])], b'    1    1    2    3    0')
+        self.assertEqual(len(sections['QM']), 1)
+        self.assertEqual(len(data[slice(*sections['QM'][0])].splitlines()), 2)
+
+        reinforcement = ReinforcementData().import_reinforcement(data, sections['QM'])
+        self.assertEqual(reinforcement[1].tolist(), [0.25, 0.75, 0.0, 0.43, 0.87, 0.0, 0.17, 0.0, 0.0])
+
+    def test_parse_blocks(self):
+        with self.subTest('Nodes'):
+            block = b'    1   0.000   0.000   0.000\n    2   6.000   0.500   1.000'
+            nodes_index, nodes_coordinates = ReinforcementData.parse_node_block(block)
+
+            self.assertEqual(nodes_index.dtype, np.int32)
+            self.assertEqual(nodes_index.tolist(), [1, 2])
+            self.assertEqual(nodes_coordinates.tolist(), [[0, 0, 0], [6, 0.5, 1]])
+
+        with self.subTest('Elements'):
+            block = b'    1   10    1    5   11\n    2   11    5    6    0'
+            elements = ReinforcementData.parse_element_block(block)
+
+            self.assertEqual(elements.tolist(), [[1, 10, 1, 5, 11], [2, 11, 5, 6, 0]])
+
+        with self.subTest('Error line number'):
+            block = b'    1   0.000   0.000   0.000\n    2   6.000   0.500\n    3   6.000   0.500   1.000'
+
+            with self.assertRaisesRegex(AssertionError, 'line 11'):
+                ReinforcementData.parse_node_block(block, first_line=10)
+
+    def test_mapped_reinforcement_data(self):
+        data = b'1.0 Nemetschek ALLPLAN\nasf\nGL POLY 3\n   0.000   0.000   0.000\n   1.000   0.000   0.000\n' \
+               b'   0.000   1.000   0.000\nGP KNOT 3\n    1   0.000   0.000   0.000\n    2   1.000   0.000   0.000\n' \
+               b'    3   0.000   1.000   0.000\nGF ELEM 1\n    1    1    2    3    0\n' \
+               b'QR  1  202510   0.000   0.000   0.000   0.000  90.000\n' \
+               b'QM  0 0   0.333   0.333   0.000    0.39    0.40    0.00    0.02    0.03    0.00\n'
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'test.asf')
+            with open(path, 'wb') as f:
+                f.write(data)
+
+            reinforcement = MappedReinforcementData(path)
+            reinforcement.chunk_size = 8
+
+            self.assertEqual(reinforcement.reinforcement_column('Top_Y').tolist(), [0.40])
+            self.assertNotIn('nodes_table', reinforcement.parsed)
+            self.assertEqual(reinforcement.nodes_table.index.tolist(), [1, 2, 3])
+            self.assertEqual(reinforcement.connectivity.element_nodes(1).tolist(), [1, 2, 3])
+            self.assertAlmostEqual(reinforcement.elements_table.loc[1, 'Element_center_X'], 1 / 3)
+            self.assertEqual(reinforcement.reinforcement_table.Bot_Y.tolist(), [0.03])
+            self.assertEqual(len(reinforcement.polygons), 1)
+
+            reinforcement.close()
+
+    def test_model_cache(self):
+        data = b'GL POLY 3\n   0.000   0.000   0.000\n   1.000   0.000   0.000\n   0.000   1.000   0.000\n' \
+               b'GP KNOT 3\n    1   0.000   0.000   0.000\n    2   1.000   0.000   0.000\n' \
+               b'    3   0.000   1.000   0.000\n' \
+               b'GF ELEM 1\n    1    1    2    3    0\n' \
+               b'QM  0 0   0.333   0.333   0.000    0.39    0.40    0.00    0.02    0.03    0.00\n'
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'test.asf')
+            with open(path, 'wb') as f:
+                f.write(data)
+
+            cache = ModelCache()
+            self.assertIsNone(cache.load(path, 'asf', ReinforcementData.cache_version))
+
+            reinforcement = ReinforcementData()
+            reinforcement.import_asf(path)
+            arrays = model_cache.load(path, 'asf', ReinforcementData.cache_version)
+            self.assertIsNotNone(arrays)
+
+            cached_reinforcement = ReinforcementData()
+            cached_reinforcement.load_arrays(arrays)
+            self.assertTrue(cached_reinforcement.nodes_table.equals(reinforcement.nodes_table))
+            self.assertTrue(cached_reinforcement.reinforcement_table.equals(reinforcement.reinforcement_table))
+            self.assertEqual(cached_reinforcement.connectivity.element_nodes(1).tolist(), [1, 2, 3])
+            self.assertAlmostEqual(cached_reinforcement.elements_table.loc[1, 'Element_center_Y'], 1 / 3)
+            self.assertEqual(cached_reinforcement.polygons[0].tolist(), reinforcement.polygons[0].tolist())
+
+            cache_path = model_cache.cache_path(path, 'asf', ReinforcementData.cache_version)
+            with self.subTest(msg='Truncated entry'):
+                with open(cache_path, 'r+b') as f:
+                    f.truncate(os.path.getsize(cache_path) // 2)
+
+                self.assertIsNone(model_cache.load(path, 'asf', ReinforcementData.cache_version))
+                self.assertFalse(os.path.exists(cache_path))
+
+                parsed_reinforcement = ReinforcementData()
+                parsed_reinforcement.import_asf(path)
+                self.assertTrue(parsed_reinforcement.reinforcement_table.equals(reinforcement.reinforcement_table))
+                self.assertIsNotNone(model_cache.load(path, 'asf', ReinforcementData.cache_version))
+
+            with self.subTest(msg='Entry with missing arrays'):
+                model_cache.store(path, 'asf', ReinforcementData.cache_version, {'nodes_index': np.arange(3)})
+
+                parsed_reinforcement = ReinforcementData()
+                parsed_reinforcement.import_asf(path)
+                self.assertTrue(parsed_reinforcement.nodes_table.equals(reinforcement.nodes_table))
+                self.assertIn('reinforcement', model_cache.load(path, 'asf', ReinforcementData.cache_version))
+
+            cache.max_size = 0
+            cache.store(path, 'test', 1, arrays, cache.content_key(path))
+            self.assertEqual(len(os.listdir(os.path.join(directory, cache.folder_name))), 1)
+            self.assertIsNotNone(cache.load(path, 'test', 1))
+
+            cache.max_size = 2 ** 20
+            cache.store_keyed(directory, 'matches', 1, 'abc', {'rows': np.arange(3, dtype=np.int32)})
+            self.assertEqual(cache.load_keyed(directory, 'matches', 1, 'abc')['rows'].tolist(), [0, 1, 2])
+            self.assertIsNone(cache.load_keyed(directory, 'matches', 1, 'abd'))
+
+            cache.enabled = False
+            self.assertIsNone(cache.content_key(path))
+            self.assertIsNone(cache.load(path, 'test', 1))
+            self.assertIsNone(cache.load_keyed(directory, 'matches', 1, 'abc'))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -2,7 +2,25 @@ import unittest
 import numpy as np
 import pandas as pd
 
-from structures.reinforcement_zone import ReinforcementZone
+from structures.reinforcement_zone import ReinforcementZone, ZoneSet
+from structures.reinforcement_scheme import ReinforcementScheme
+from utils.mesh_tools import Connectivity
+
+
+def make_strip_connectivity() -> Connectivity:
+    """Strip of 6 quads, element i has nodes i, i + 1 at Y = 0 and i + 7, i + 8 at Y = 1"""
+    return Connectivity.from_padded(np.arange(1, 7), [[i, i + 1, i + 8, i + 7] for i in range(1, 7)])
+
+
+def make_strip_scheme(elements_data: dict) -> ReinforcementScheme:
+    scheme = ReinforcementScheme()
+    scheme.connectivity = make_strip_connectivity()
+    scheme.nodes_table = pd.DataFrame(index=np.arange(1, 15), columns=('X', 'Y', 'Z'),
+                                      data=[[i % 7, i // 7, 0] for i in range(14)])
+    scheme.elements_table = pd.DataFrame(index=np.arange(1, 7), data=elements_data)
+    scheme.scad_data.directions = np.array([[1, 0, 0], [1, 1, 0]])
+    scheme.background_reinforcement = {'diameter': 8, 'step': 200}
+    return scheme
 
 
 class ZoneTest(unittest.TestCase):
@@ -338,6 +356,162 @@ class ZoneTest(unittest.TestCase):
             self.assertAlmostEqual(zone.bounding_rectangle_adjusted[3, 0], -10.509898, delta=0.01)
             self.assertAlmostEqual(zone.bounding_rectangle_adjusted[3, 1], -14.448188, delta=0.01)
 
+    def test_find_reinforcement_zones(self):
+        # elements 2 and 4 are below the threshold
+        scheme = make_strip_scheme({'Top_X': [5, 1, 5, 1, 5, 5]})
+
+        scheme.find_reinforcement_zones('Top_X', min_value=2)
+        zones = scheme.reinforcement_zones['Top_X']
+
+        self.assertEqual([zone.elements.tolist() for zone in zones], [[1], [3], [5, 6]])
+        self.assertEqual(zones[2].nodes.tolist(), [5, 6, 7, 12, 13, 14])
+
+        swept_zones = scheme.sweep_reinforcement_zones('Top_X', [2, 0, 6])
+        self.assertEqual([[zone.elements.tolist() for zone in zones] for zones in swept_zones],
+                         [[[1], [3], [5, 6]], [[1, 2, 3, 4, 5, 6]], []])
+
+    def test_process_locations(self):
+        elements_data = {'Top_X': [50, 1, 50, 1, 50, 50], 'Lat_X': [50, 50, 1, 1, 1, 50],
+                         'Rotation_code': [0, 0, 0, 0, 0, 1], 'Direction_id': [0, 0, 0, 0, 1, 1]}
+
+        sequential_scheme = make_strip_scheme(elements_data)
+        for location in ['Top_X', 'Lat_X']:
+            sequential_scheme.find_reinforcement_zones(location)
+            sequential_scheme.transfer_reinforcement_direction_to_zones()
+            sequential_scheme.set_zones_reinforcement()
+
+        scheme = make_strip_scheme(elements_data)
+        scheme.process_locations(['Top_X', 'Lat_X'], workers=2)
+
+        for location in ['Top_X', 'Lat_X']:
+            zones = scheme.reinforcement_zones[location]
+            sequential_zones = sequential_scheme.reinforcement_zones[location]
+
+            self.assertEqual([zone.elements.tolist() for zone in zones],
+                             [zone.elements.tolist() for zone in sequential_zones])
+            self.assertEqual([zone.reinforcement_direction_vector for zone in zones],
+                             [zone.reinforcement_direction_vector for zone in sequential_zones])
+            self.assertEqual([zone.max_intensity for zone in zones], [zone.max_intensity for zone in sequential_zones])
+
+    def test_transfer_reinforcement_direction_to_zones(self):
+        scheme = make_strip_scheme({'Top_X': [50, 50, 1, 50, 50, 50], 'Rotation_code': [1, 1, 0, 0, 0, 0],
+                                    'Direction_id': [0, 0, 0, 1, 0, 1]})
+
+        scheme.find_reinforcement_zones('Top_X')
+        scheme.transfer_reinforcement_direction_to_zones()
+        zones = scheme.reinforcement_zones['Top_X']
+
+        self.assertEqual([zone.elements.tolist() for zone in zones], [[1, 2], [5], [4, 6]])
+        self.assertEqual([list(map(float, zone.reinforcement_direction_vector)) for zone in zones],
+                         [[0, -1, 0], [1, 0, 0], [1, 1, 0]])
+        self.assertEqual([zone.nodes.tolist() for zone in zones], [[1, 2, 3, 8, 9, 10], [5, 6, 12, 13],
+                                                                  [4, 5, 6, 7, 11, 12, 13, 14]])
+        self.assertEqual([zone.reinforcement_direction for zone in zones], ['X', 'X', 'X'])
+
+        with self.subTest(msg='Mixed rotation codes only'):
+            scheme = make_strip_scheme({'Top_X': [50] * 6, 'Rotation_code': [0, 1, 0, 0, 0, 0],
+                                        'Direction_id': [0] * 6})
+            scheme.find_reinforcement_zones('Top_X')
+            scheme.transfer_reinforcement_direction_to_zones()
+            zones = scheme.reinforcement_zones['Top_X']
+
+            self.assertEqual([zone.elements.tolist() for zone in zones], [[1, 2, 3, 4, 5, 6]])
+            self.assertEqual(zones[0].reinforcement_direction_vector, [0, 0, 0])
+            self.assertIsNone(zones[0].bounding_rectangle)
+
+    def test_zone_hull(self):
+        zone = ReinforcementZone()
+        zone.add_multiple_elements_to_zone([1], [1, 2, 3], np.array([[0, 0, 0], [2, 0, 0], [0, 2, 0]]))
+        zone.add_one_element_to_zone(2, [2, 3, 4], np.array([[2, 0, 0], [0, 2, 0], [2, 2, 0]]))
+        self.assertEqual(zone.hull.tolist(), [[0, 0], [2, 0], [2, 2], [0, 2]])
+
+        zone.add_multiple_elements_to_zone([3], [4, 5])
+        self.assertIsNone(zone.hull)
+
+        scheme = ReinforcementScheme()
+        scheme.nodes_table = pd.DataFrame(index=[1, 2, 3, 4], columns=('X', 'Y', 'Z'),
+                                          data=[[0, 0, 0], [3, 3, 0], [2, 4, 0], [-1, 1, 0]])
+        scheme.hull_min_nodes = 1
+        zone = ReinforcementZone()
+        zone.add_multiple_elements_to_zone([1], [1, 2, 3, 4])
+
+        np.testing.assert_allclose(scheme.get_zone_bounding_rectangle(zone), [[-1, -1, 3, 3], [0, 4, 4, 0]], atol=1e-6)
+        self.assertEqual(zone.hull.shape, (4, 2))
+
+        scheme.minimum_area_rectangles = True
+        zone.set_reinforcement_direction(0, 0, 0)
+        rectangle = scheme.get_zone_bounding_rectangle(zone)
+        np.testing.assert_allclose(zone.reinforcement_direction_vector, [np.sqrt(0.5), -np.sqrt(0.5), 0])
+        np.testing.assert_allclose(rectangle, [[-1, 2, 3, 0], [1, 4, 3, 0]], atol=1e-6)
+
+    def test_zone_set(self):
+        connectivity = make_strip_connectivity()
+        zones = ZoneSet.from_groups([6, 1, 5, 3], [4, 2, 4, 2], connectivity)
+
+        self.assertEqual(len(zones), 2)
+        self.assertEqual(zones.element_zones.tolist(), [0, 0, 1, 1])
+        self.assertEqual([zone.elements.tolist() for zone in zones], [[1, 3], [5, 6]])
+        self.assertEqual(zones[-1].nodes.tolist(), [5, 6, 7, 12, 13, 14])
+
+        zones[1].set_reinforcement_direction(1, 1, 0)
+        zones[1].max_intensity = 10
+        self.assertEqual(zones.direction_vectors[1].tolist(), [1, 1, 0])
+        self.assertEqual(zones[0].max_intensity, None)
+
+        zones = ZoneSet.concatenate([zones.take([1]), ZoneSet.from_groups([2], [0], connectivity)])
+        self.assertEqual([zone.elements.tolist() for zone in zones], [[5, 6], [2]])
+        self.assertEqual([zone.reinforcement_direction_vector for zone in zones], [[1, 1, 0], [0, 0, 0]])
+        self.assertEqual(zones.max_intensities[0], 10)
+
+        zones[1].add_multiple_elements_to_zone([4], connectivity.nodes_of([4]))
+        self.assertEqual(zones[1].elements.tolist(), [2, 4])
+        self.assertEqual(zones[1].nodes.tolist(), [2, 3, 4, 5, 9, 10, 11, 12])
+        self.assertEqual(zones[0].nodes.tolist(), [5, 6, 7, 12, 13, 14])
+
+    def test_cached_properties(self):
+        zone = ReinforcementZone()
+        zone.bounding_rectangle = np.array([[0, 0], [0.1, 0], [0.1, 1], [0, 1]])
+        zone.reinforcement_direction_vector = [0, 3, 0]
+        zone.anchorage_lengths = pd.DataFrame(index=[6, 8, 10], data=[1000, 1000, 1000], columns=('Length',))
+        zone.background_reinforcement_intensity = 3.93
+        zone.background_reinforcement = {'diameter': 10, 'step': 200}
+        zone.max_intensity = 3.93 + 1.40
+        zone.reinforcement_direction = 'X'
+
+        calls = []
+        reinforcement_from_intensity = zone.calculator.reinforcement_from_intensity
+        zone.calculator.reinforcement_from_intensity = lambda *args, **kwargs: \
+            calls.append(args) or reinforcement_from_intensity(*args, **kwargs)
+
+        rectangle = zone.bounding_rectangle_adjusted.copy()
+        for _ in range(3):
+            zone.bounding_rectangle_adjusted, zone.dimensions_adjusted, zone.midpoint, zone.additional_reinforcement
+        self.assertEqual(len(calls), 2)
+
+        zone.reinforcement_direction_vector = [3, 0, 0]
+        self.assertAlmostEqual(zone.dimensions[0], 0.1)
+        self.assertFalse(np.allclose(zone.bounding_rectangle_adjusted, rectangle))
+
+        zone.max_intensity = 3.93 + 5.64
+        self.assertEqual(zone.additional_reinforcement['diameter'], 12)
+        self.assertEqual(len(calls), 4)
+
+    def test_zone_builder(self):
+        connectivity = make_strip_connectivity()
+        zone = ReinforcementZone()
+        zone.add_one_element_to_zone(3, connectivity.nodes_of([3]))
+
+        zone.start_building()
+        zone.add_multiple_elements_to_zone([5, 1], connectivity.nodes_of([5, 1]))
+        zone.add_one_element_to_zone(3, [0, 99])
+        zone.add_multiple_elements_to_zone([100, 5], [0, 200, 6])
+        self.assertEqual(zone.elements.tolist(), [3])
+
+        zone.finish_building()
+        self.assertIsNone(zone.builder)
+        self.assertEqual(zone.elements.tolist(), [1, 3, 5, 100])
+        self.assertEqual(zone.nodes.tolist(), [1, 2, 3, 4, 5, 6, 8, 9, 10, 11, 12, 13, 200])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,398 @@
+from typing import List, Optional, Sequence
+from itertools import product
+import numpy as np
+
+
+class Connectivity:
+    """Element node lists in CSR form: nodes of the i-th element are nodes[offsets[i]:offsets[i + 1]]"""
+    def __init__(self, elements: np.array, offsets: np.array, nodes: np.array):
+        self.elements = np.asarray(elements, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.nodes = np.asarray(nodes, dtype=np.int64)
+        self.element_sort = None  # (sorted elements, their order), computed on the first position lookup
+
+        assert len(self.offsets) == len(self.elements) + 1, 'Connectivity offsets do not match elements'
+
+    @classmethod
+    def from_padded(cls, elements: np.array, padded_nodes: np.array) -> 'Connectivity':
+        """Connectivity from a node matrix where missing nodes are zeros"""
+        padded_nodes = np.asarray(padded_nodes)
+        valid = padded_nodes != 0
+        offsets = np.concatenate(([0], np.cumsum(valid.sum(axis=1))))
+
+        return cls(elements, offsets, padded_nodes[valid])
+
+    @classmethod
+    def from_lists(cls, elements: np.array, node_lists: Sequence[Sequence[int]]) -> 'Connectivity':
+        lengths = np.fromiter(map(len, node_lists), dtype=np.int64, count=len(node_lists))
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        nodes = np.concatenate([np.zeros(0, dtype=np.int64)] + [np.asarray(nodes, dtype=np.int64)
+                                                                for nodes in node_lists])
+
+        return cls(elements, offsets, nodes)
+
+    def __len__(self) -> int:
+        return len(self.elements)
+
+    @property
+    def lengths(self) -> np.array:
+        return np.diff(self.offsets)
+
+    @property
+    def slot_positions(self) -> np.array:
+        """Element position of every entry of nodes"""
+        return np.repeat(np.arange(len(self.elements)), self.lengths)
+
+    def positions(self, elements: np.array) -> np.array:
+        if self.element_sort is None:
+            order = np.argsort(self.elements, kind='stable')
+            self.element_sort = self.elements[order], order
+
+        sorted_elements, order = self.element_sort
+        positions = MeshTools.sorted_index_positions(sorted_elements, elements)
+        positions = np.where(positions >= 0, order[positions], -1)
+
+        missing = positions < 0
+        assert not np.any(missing), f'Element {np.asarray(elements)[missing][0]} not in connectivity'
+
+        return positions
+
+    def element_nodes(self, element: int) -> np.array:
+        position = self.positions(np.array([element]))[0]
+        return self.nodes[self.offsets[position]:self.offsets[position + 1]]
+
+    def slots_of(self, elements: np.array) -> np.array:
+        """Indices into nodes of all node slots of the elements, element by element"""
+        positions = self.positions(np.asarray(elements, dtype=np.int64).ravel())
+        lengths = self.lengths[positions]
+        starts = self.offsets[positions]
+
+        first_slots = np.cumsum(lengths) - lengths
+        return np.repeat(starts - first_slots, lengths) + np.arange(lengths.sum())
+
+    def nodes_of(self, elements: np.array) -> np.array:
+        """Nodes of the elements, concatenated element by element"""
+        return self.nodes[self.slots_of(elements)]
+
+    def subset(self, elements: np.array) -> 'Connectivity':
+        elements = np.asarray(elements, dtype=np.int64).ravel()
+        lengths = self.lengths[self.positions(elements)]
+
+        return Connectivity(elements, np.concatenate(([0], np.cumsum(lengths))), self.nodes_of(elements))
+
+    def elements_with_nodes(self, nodes: np.array) -> np.array:
+        """Sorted unique elements containing any of the nodes"""
+        slots = np.isin(self.nodes, nodes)
+        return np.unique(self.elements[self.slot_positions[slots]])
+
+    def connected_components(self, elements: np.array) -> np.array:
+        """Component of every element of elements, where elements sharing a node are connected.
+        Components are labeled by the position of their first element in elements"""
+        return NodeElementIndex(self.subset(elements)).connected_components(elements)
+
+    def dangling_nodes(self, nodes: np.array) -> np.array:
+        """Sorted unique referenced nodes that are not in nodes"""
+        return np.unique(self.nodes[~np.isin(self.nodes, nodes)])
+
+    def padded(self) -> np.array:
+        """Node matrix with rows padded by zeros"""
+        lengths = self.lengths
+        padded_nodes = np.zeros((len(lengths), lengths.max(initial=0)), dtype=np.int64)
+        padded_nodes[np.arange(padded_nodes.shape[1]) < lengths[:, None]] = self.nodes
+
+        return padded_nodes
+
+
+class NodeElementIndex:
+    """Inverted connectivity in CSR form: elements of the i-th node are elements[offsets[i]:offsets[i + 1]]"""
+    def __init__(self, connectivity: Connectivity):
+        order = np.argsort(connectivity.nodes, kind='stable')
+        self.nodes, counts = np.unique(connectivity.nodes[order], return_counts=True)
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+        self.elements = connectivity.elements[connectivity.slot_positions[order]]
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def positions(self, nodes: np.array) -> np.array:
+        positions = MeshTools.sorted_index_positions(self.nodes, nodes)
+
+        missing = positions < 0
+        assert not np.any(missing), f'Node {np.asarray(nodes)[missing][0]} not in node index'
+
+        return positions
+
+    def node_elements(self, node: int) -> np.array:
+        position = self.positions(np.array([node]))[0]
+        return self.elements[self.offsets[position]:self.offsets[position + 1]]
+
+    def elements_with_nodes(self, nodes: np.array) -> np.array:
+        """Sorted unique elements containing any of the nodes"""
+        positions = MeshTools.sorted_index_positions(self.nodes, np.asarray(nodes, dtype=np.int64).ravel())
+        positions = positions[positions >= 0]
+
+        lengths = self.offsets[positions + 1] - self.offsets[positions]
+        first_slots = np.cumsum(lengths) - lengths
+        slots = np.repeat(self.offsets[positions] - first_slots, lengths) + np.arange(lengths.sum())
+
+        return np.unique(self.elements[slots])
+
+    def connected_components(self, elements: np.array) -> np.array:
+        """Component of every element of elements, where elements sharing a node are connected.
+        Components are labeled by the position of their first element in elements"""
+        elements = np.asarray(elements, dtype=np.int64).ravel()
+        if len(elements) == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        slot_elements, slot_nodes = self.element_slots(elements)
+        node_starts = np.flatnonzero(np.concatenate(([True], np.diff(slot_nodes) != 0)))
+        node_first_elements = np.repeat(slot_elements[node_starts], np.diff(np.append(node_starts, len(slot_nodes))))
+
+        return MeshTools.union_components(np.arange(len(elements)), slot_elements, node_first_elements)
+
+    def threshold_components(self, elements: np.array, values: np.array, thresholds: Sequence[float]) -> List[np.array]:
+        """Components of elements with values above each of the thresholds labeled as in connected_components, -1 for
+        the rest of elements.
+
+        Every element is linked to the element with the largest value of each of its nodes, so a link is in the graph
+        of a threshold when the value of the element is above it. Links are added in order of decreasing values and
+        components of all thresholds cost about one connected_components call"""
+        elements = np.asarray(elements, dtype=np.int64).ravel()
+        values = np.asarray(values, dtype=float).ravel()
+
+        slot_elements, slot_nodes = self.element_slots(elements)
+        order = np.lexsort((-values[slot_elements], slot_nodes))
+        slot_elements, slot_nodes = slot_elements[order], slot_nodes[order]
+
+        node_starts = np.flatnonzero(np.concatenate(([True], np.diff(slot_nodes) != 0)))
+        node_first_elements = np.repeat(slot_elements[node_starts], np.diff(np.append(node_starts, len(slot_nodes))))
+
+        link_order = np.argsort(-values[slot_elements], kind='stable')
+        first, second = slot_elements[link_order], node_first_elements[link_order]
+        negative_link_values = -values[first]
+
+        parents = np.arange(len(elements))
+        components = [np.zeros(0, dtype=np.int64)] * len(thresholds)
+        added_links = 0
+        for i in np.argsort(thresholds)[::-1]:
+            links = np.searchsorted(negative_link_values, -thresholds[i], side='left')
+            parents = MeshTools.union_components(parents, first[added_links:links], second[added_links:links])
+            added_links = max(added_links, links)
+
+            components[i] = np.where(values > thresholds[i], parents, -1)
+
+        return components
+
+    def element_slots(self, elements: np.array) -> (np.array, np.array):
+        """Positions in elements and node positions of the index slots of the elements, ordered by node"""
+        slot_elements = MeshTools.index_positions(elements, self.elements)
+        selected = slot_elements >= 0
+
+        slot_nodes = np.repeat(np.arange(len(self.nodes)), np.diff(self.offsets))
+        return slot_elements[selected], slot_nodes[selected]
+
+
+class MeshTools:
+    @staticmethod
+    def union_components(parents: np.array, first: np.array, second: np.array) -> np.array:
+        """Union-find over links between first and second elements, parents of all elements must be roots.
+        Roots are hooked to the smaller root and paths are compressed until every element points to the smallest
+        element of its component"""
+        while True:
+            first_roots, second_roots = parents[first], parents[second]
+            linked = first_roots != second_roots
+            if not np.any(linked):
+                return parents
+
+            np.minimum.at(parents, np.maximum(first_roots, second_roots)[linked],
+                          np.minimum(first_roots, second_roots)[linked])
+
+            grandparents = parents[parents]
+            while not np.array_equal(grandparents, parents):
+                parents = grandparents
+                grandparents = parents[parents]
+
+    @staticmethod
+    def index_positions(index: np.array, values: np.array) -> np.array:
+        """Positions of values in index, -1 for values that are not in it"""
+        index = np.asarray(index)
+        values = np.asarray(values)
+        if len(index) == 0:
+            return np.full(values.shape, -1, dtype=np.int64)
+
+        order = np.argsort(index, kind='stable')
+        positions = MeshTools.sorted_index_positions(index[order], values)
+
+        return np.where(positions >= 0, order[positions], -1)
+
+    @staticmethod
+    def sorted_index_positions(sorted_index: np.array, values: np.array) -> np.array:
+        """Positions of values in sorted index, -1 for values that are not in it"""
+        values = np.asarray(values)
+        if len(sorted_index) == 0:
+            return np.full(values.shape, -1, dtype=np.int64)
+
+        positions = np.minimum(np.searchsorted(sorted_index, values), len(sorted_index) - 1)
+        return np.where(sorted_index[positions] == values, positions, -1)
+
+    @staticmethod
+    def element_centers(connectivity: Connectivity, nodes_index: np.array, nodes_coordinates: np.array) -> np.array:
+        """Mean coordinates of the nodes of every element"""
+        nodes_coordinates = np.asarray(nodes_coordinates, dtype=float)
+        positions = MeshTools.index_positions(nodes_index, connectivity.nodes)
+
+        missing = positions < 0
+        assert not np.any(missing), f'Node {connectivity.nodes[missing][0]} not in Nodes table'
+
+        slot_positions = connectivity.slot_positions
+        coordinates = nodes_coordinates[positions]
+        sums = np.column_stack([np.bincount(slot_positions, weights=coordinates[:, i], minlength=len(connectivity))
+                                for i in range(coordinates.shape[1])])
+
+        return sums / connectivity.lengths[:, None]
+
+    @staticmethod
+    def oriented_bounding_rectangles(points: np.array, lengths: np.array, angles: np.array) -> np.array:
+        """(m, 2, 4) corners of the bounding rectangle of each of m consecutive point segments of given lengths, with
+        sides along the segment angle. Points are rotated to local axes at once and reduced per segment"""
+        points = np.asarray(points, dtype=float)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        assert np.all(lengths > 0), 'Empty point segment'
+
+        cos, sin = np.cos(angles), np.sin(angles)
+        point_cos, point_sin = np.repeat(cos, lengths), np.repeat(sin, lengths)
+        local_x = point_cos * points[:, 0] + point_sin * points[:, 1]
+        local_y = point_cos * points[:, 1] - point_sin * points[:, 0]
+
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        min_x, max_x = np.minimum.reduceat(local_x, starts), np.maximum.reduceat(local_x, starts)
+        min_y, max_y = np.minimum.reduceat(local_y, starts), np.maximum.reduceat(local_y, starts)
+
+        corners_x = np.column_stack((min_x, min_x, max_x, max_x))
+        corners_y = np.column_stack((min_y, max_y, max_y, min_y))
+
+        return np.stack((cos[:, None] * corners_x - sin[:, None] * corners_y,
+                         sin[:, None] * corners_x + cos[:, None] * corners_y), axis=1)
+
+    @staticmethod
+    def convex_hull(points: np.array) -> np.array:
+        """(k, 2) vertices of the convex hull of 2d points in counterclockwise order, without collinear points.
+        Points inside the octagon of extreme points along 8 directions are dropped before the monotone chain"""
+        points = np.unique(np.asarray(points, dtype=float).reshape(-1, 2), axis=0)
+        if len(points) < 3:
+            return points
+
+        directions = np.array([[1, 0], [1, 1], [0, 1], [-1, 1], [-1, 0], [-1, -1], [0, -1], [1, -1]])
+        extremes = np.argmax(points @ directions.T, axis=0)
+        octagon = points[extremes[np.sort(np.unique(extremes, return_index=True)[1])]]
+        if len(octagon) >= 3:
+            edges = np.roll(octagon, -1, axis=0) - octagon
+            crosses = (edges[:, 0] * (points[:, None, 1] - octagon[:, 1]) -
+                       edges[:, 1] * (points[:, None, 0] - octagon[:, 0]))
+            points = points[~np.all(crosses > 0, axis=1)]
+
+        def chain(chain_points):
+            vertices = []
+            for x, y in chain_points:
+                while len(vertices) >= 2 and ((vertices[-1][0] - vertices[-2][0]) * (y - vertices[-2][1]) -
+                                              (vertices[-1][1] - vertices[-2][1]) * (x - vertices[-2][0])) <= 0:
+                    vertices.pop()
+                vertices.append((x, y))
+            return vertices
+
+        point_list = points.tolist()
+        return np.array(chain(point_list)[:-1] + chain(point_list[::-1])[:-1])
+
+    @staticmethod
+    def minimum_area_rectangle_angle(hull: np.array, chunk_size: int = 256) -> float:
+        """Angle in [-pi/4, pi/4) of the minimum area bounding rectangle of convex hull vertices. Every rectangle the
+        rotating calipers visit, with a side along a hull edge, is evaluated in vectorized chunks of edges"""
+        hull = np.asarray(hull, dtype=float)
+        if len(hull) < 2:
+            return 0.
+
+        edges = np.roll(hull, -1, axis=0) - hull
+        angles = np.unique((np.arctan2(edges[:, 1], edges[:, 0]) + np.pi / 4) % (np.pi / 2) - np.pi / 4)
+
+        best_angle, best_area = 0., np.inf
+        for start in range(0, len(angles), chunk_size):
+            chunk = angles[start:start + chunk_size]
+            cos, sin = np.cos(chunk)[:, None], np.sin(chunk)[:, None]
+            local_x = cos * hull[:, 0] + sin * hull[:, 1]
+            local_y = cos * hull[:, 1] - sin * hull[:, 0]
+            areas = np.ptp(local_x, axis=1) * np.ptp(local_y, axis=1)
+
+            if areas.min() < best_area:
+                best_angle, best_area = chunk[np.argmin(areas)], areas.min()
+
+        return float(best_angle)
+
+    @staticmethod
+    def align_sorted_points(points: np.array, reference_points: np.array,
+                            tolerance: float = 1e-3) -> Optional[np.array]:
+        """Position of the reference point for each of the points when both are the same point set in different order.
+        Points are sorted by X, Y and Z rounded to tolerance and paired row by row. None if the sets differ in size or
+        any pair is not closer than tolerance along every axis"""
+        points = np.asarray(points, dtype=float)
+        reference_points = np.asarray(reference_points, dtype=float)
+        if points.shape != reference_points.shape:
+            return None
+
+        point_order = np.lexsort(np.round(points / tolerance).T[::-1])
+        reference_order = np.lexsort(np.round(reference_points / tolerance).T[::-1])
+
+        if not np.all(np.abs(points[point_order] - reference_points[reference_order]) < tolerance):
+            return None
+
+        matches = np.empty(len(points), dtype=np.int64)
+        matches[point_order] = reference_order
+
+        return matches
+
+    @staticmethod
+    def match_points(points: np.array, reference_points: np.array, tolerance: float = 1e-3) -> np.array:
+        """Position of the reference point closer than tolerance along every axis for each of the points,
+        -1 for points without such reference point and -2 for points with several of them.
+
+        Reference points are hashed to a grid with cells not smaller than tolerance, so candidates of a point are in
+        its own and the neighbouring cells"""
+        points = np.asarray(points, dtype=float)
+        reference_points = np.asarray(reference_points, dtype=float)
+        if len(points) == 0 or len(reference_points) == 0:
+            return np.full(len(points), -1, dtype=np.int64)
+
+        origin = np.minimum(points.min(axis=0), reference_points.min(axis=0))
+        extent = np.maximum(points.max(axis=0), reference_points.max(axis=0)) - origin
+        cell_size = max(tolerance, extent.max() / 2 ** 20)
+
+        point_cells = np.floor((points - origin) / cell_size).astype(np.int64) + 1
+        reference_cells = np.floor((reference_points - origin) / cell_size).astype(np.int64) + 1
+        shape = np.maximum(point_cells.max(axis=0), reference_cells.max(axis=0)) + 2
+
+        reference_keys = np.ravel_multi_index(reference_cells.T, shape)
+        order = np.argsort(reference_keys, kind='stable')
+        sorted_keys = reference_keys[order]
+
+        point_candidates, reference_candidates = [], []
+        for offset in product((-1, 0, 1), repeat=3):
+            keys = np.ravel_multi_index((point_cells + offset).T, shape)
+            first = np.searchsorted(sorted_keys, keys, side='left')
+            counts = np.searchsorted(sorted_keys, keys, side='right') - first
+
+            point_positions = np.repeat(np.arange(len(points)), counts)
+            slots = np.repeat(first - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+
+            point_candidates.append(point_positions)
+            reference_candidates.append(order[slots])
+
+        point_candidates = np.concatenate(point_candidates)
+        reference_candidates = np.concatenate(reference_candidates)
+
+        close = np.all(np.abs(points[point_candidates] - reference_points[reference_candidates]) < tolerance, axis=1)
+        point_candidates = point_candidates[close]
+
+        matches = np.full(len(points), -1, dtype=np.int64)
+        matches[point_candidates] = reference_candidates[close]
+        matches[np.bincount(point_candidates, minlength=len(points)) > 1] = -2
+
+        return matches
@@ -0,0 +1,124 @@
+from typing import Dict, Optional
+import numpy as np
+import hashlib
+import os
+
+
+class ModelCache:
+    """Binary cache of parsed models, stored as .npz files in a folder next to the source file.
+
+    Entries are keyed on the source content hash, the kind of model and the parser version, so editing the source or
+    changing the parser invalidates them. Keyed entries are stored in the folder under a key computed by the caller.
+    The least recently used entries are removed when the folder grows beyond max_size bytes. Entries that cannot be
+    read, or that the caller fails to unpack and discards, are removed and treated as missing."""
+    def __init__(self, enabled: bool = True, max_size: int = 256 * 2 ** 20, folder_name: str = '__modelcache__'):
+        self.enabled = enabled
+        self.max_size = max_size
+        self.folder_name = folder_name
+
+    def content_key(self, path: str) -> Optional[str]:
+        """Content hash of the source file, computed once by the caller and passed to load, discard and store.
+        None when the cache is disabled"""
+        if not self.enabled:
+            return None
+
+        return self.content_hash(path)
+
+    def load(self, path: str, kind: str, version: int, content_key: str = None) -> Optional[Dict[str, np.array]]:
+        if not self.enabled:
+            return None
+
+        return self.read(self.cache_path(path, kind, version, content_key))
+
+    def load_keyed(self, folder: str, kind: str, version: int, key: str) -> Optional[Dict[str, np.array]]:
+        if not self.enabled:
+            return None
+
+        return self.read(self.keyed_path(folder, kind, version, key))
+
+    @staticmethod
+    def read(cache_path: str) -> Optional[Dict[str, np.array]]:
+        if not os.path.isfile(cache_path):
+            return None
+
+        try:
+            with np.load(cache_path, allow_pickle=False) as cache_file:
+                arrays = {key: cache_file[key] for key in cache_file.files}
+        except Exception:
+            ModelCache.remove(cache_path)
+            return None
+
+        os.utime(cache_path)
+        return arrays
+
+    def discard(self, path: str, kind: str, version: int, content_key: str = None) -> None:
+        self.remove(self.cache_path(path, kind, version, content_key))
+
+    def discard_keyed(self, folder: str, kind: str, version: int, key: str) -> None:
+        self.remove(self.keyed_path(folder, kind, version, key))
+
+    @staticmethod
+    def remove(cache_path: str) -> None:
+        try:
+            os.remove(cache_path)
+        except OSError:
+            pass
+
+    def store(self, path: str, kind: str, version: int, arrays: Dict[str, np.array], content_key: str = None) -> None:
+        if not self.enabled:
+            return
+
+        self.write(self.cache_path(path, kind, version, content_key), arrays)
+
+    def store_keyed(self, folder: str, kind: str, version: int, key: str, arrays: Dict[str, np.array]) -> None:
+        if not self.enabled:
+            return
+
+        self.write(self.keyed_path(folder, kind, version, key), arrays)
+
+    def write(self, cache_path: str, arrays: Dict[str, np.array]) -> None:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+        temporary_path = f'{cache_path}.{os.getpid()}.tmp'
+        try:
+            with open(temporary_path, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(temporary_path, cache_path)
+        except OSError:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            return
+
+        self.evict(os.path.dirname(cache_path))
+
+    def evict(self, folder: str) -> None:
+        entries = [entry for entry in os.scandir(folder) if entry.is_file() and entry.name.endswith('.npz')]
+        entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+
+        total_size = entries[0].stat().st_size if len(entries) > 0 else 0
+        for entry in entries[1:]:
+            total_size += entry.stat().st_size
+            if total_size > self.max_size:
+                os.remove(entry.path)
+
+    def cache_path(self, path: str, kind: str, version: int, content_key: str = None) -> str:
+        if content_key is None:
+            content_key = self.content_hash(path)
+
+        folder, file_name = os.path.split(os.path.abspath(path))
+        return os.path.join(folder, self.folder_name, f'{file_name}.{kind}{version}.{content_key}.npz')
+
+    def keyed_path(self, folder: str, kind: str, version: int, key: str) -> str:
+        return os.path.join(os.path.abspath(folder), self.folder_name, f'{kind}{version}.{key}.npz')
+
+    @staticmethod
+    def content_hash(path: str, chunk_size: int = 1 << 20) -> str:
+        content_hash = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                content_hash.update(chunk)
+
+        return content_hash.hexdigest()
+
+
+model_cache = ModelCache()
@@ -1,4 +1,6 @@
 from utils.reinforcement_data import ReinforcementData
+from utils.mesh_tools import Connectivity
+from utils.scad_data import SCADData
 from structures.reinforcement_scheme import ReinforcementScheme
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
@@ -33,8 +35,8 @@ class Plotter:
             v_max += 1e-5
             v_min -= 1e-5
 
-        for element in reinforcement.elements_table.index:
-            element_nodes = reinforcement.elements_table.loc[element, 'Nodes']
+        for element in reinforcement.connectivity.elements:
+            element_nodes = reinforcement.connectivity.element_nodes(element)
             xs = reinforcement.nodes_table.loc[element_nodes, 'X'].values
             ys = reinforcement.nodes_table.loc[element_nodes, 'Y'].values
             zs = reinforcement.nodes_table.loc[element_nodes, 'Z'].values
@@ -73,9 +75,8 @@ class Plotter:
             v_max += 1e-5
             v_min -= 1e-5
 
-        for element in reinforcement.elements_table.index:
-            element_nodes = reinforcement.elements_table.loc[element, 'Nodes']
-            element_nodes = [node for node in element_nodes if node > 0]
+        for element in reinforcement.connectivity.elements:
+            element_nodes = reinforcement.connectivity.element_nodes(element)
 
             xs = reinforcement.nodes_table.loc[element_nodes, 'X'].values
             ys = reinforcement.nodes_table.loc[element_nodes, 'Y'].values
@@ -107,16 +108,15 @@ class Plotter:
 
         fig.suptitle(f'Zones {reinforcement_loc.replace("_", " ")}')
 
-        self.add_mesh_to_ax_2d(ax, scheme.nodes_table, scheme.elements_table)
+        self.add_mesh_to_ax_2d(ax, scheme.nodes_table, scheme.connectivity)
         if plot_directions:
-            self.add_force_directions_to_ax_2d(ax, scheme.elements_table)
+            self.add_force_directions_to_ax_2d(ax, scheme.elements_table, scheme.scad_data.directions)
         self.add_reinforcement_zones_to_ax_2d(ax, scheme, reinforcement_loc)
 
     @staticmethod
-    def add_mesh_to_ax_2d(ax: plt.Axes, nodes_table: pd.DataFrame, elements_table: pd.DataFrame):
-        for element in elements_table.index:
-            element_nodes = elements_table.loc[element, 'Nodes']
-            element_nodes = [node for node in element_nodes if node > 0]
+    def add_mesh_to_ax_2d(ax: plt.Axes, nodes_table: pd.DataFrame, connectivity: Connectivity):
+        for element in connectivity.elements:
+            element_nodes = connectivity.element_nodes(element)
 
             xs = nodes_table.loc[element_nodes, 'X'].values
             ys = nodes_table.loc[element_nodes, 'Y'].values
@@ -127,12 +127,13 @@ class Plotter:
             ax.plot(xs, ys, c='xkcd:grey')
 
     @staticmethod
-    def add_force_directions_to_ax_2d(ax: plt.Axes, elements_table: pd.DataFrame):
+    def add_force_directions_to_ax_2d(ax: plt.Axes, elements_table: pd.DataFrame, directions: np.array):
         for element in elements_table.index:
             x, y = elements_table.loc[element, ['Element_center_X', 'Element_center_Y']]
-            rotation_type, direction = elements_table.loc[element, ['Rotation_type', 'Direction']]
+            rotation_code, direction_id = elements_table.loc[element, ['Rotation_code', 'Direction_id']]
 
-            if rotation_type == 'EX':
+            if rotation_code == SCADData.rotation_types.index('EX'):
+                direction = directions[direction_id]
                 dx = direction[0] / max(direction) * 0.1
                 dy = direction[1] / max(direction) * 0.1
 
@@ -1,91 +1,240 @@
 import numpy as np
 import pandas as pd
 from utils.decorators import Decorators
-from typing import List
+from utils.model_cache import model_cache
+from utils.mesh_tools import Connectivity, MeshTools
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+import mmap
 import re
 
 
 class ReinforcementData:
     def __init__(self):
         self.nodes_table = pd.DataFrame(columns=('X', 'Y', 'Z'))
-        self.elements_table = pd.Series(name='Nodes', dtype=object)
+        self.elements_table = pd.DataFrame(columns=('Element_center_X', 'Element_center_Y', 'Element_center_Z'))
+        self.connectivity = Connectivity(np.zeros(0), np.zeros(1), np.zeros(0))
         self.reinforcement_table = pd.DataFrame(columns=('Element_center_X', 'Element_center_Y', 'Element_center_Z',
                                                          'Top_X', 'Top_Y', 'Lat_X', 'Bot_X', 'Bot_Y', 'Lat_Y'))
         self.polygons = []
+        self.path = None
+
+    cache_version = 2
 
     @Decorators.timed
-    def import_asf(self, path: str) -> None:
-        with open(path) as f:
+    def import_asf(self, path: str, use_cache: bool = True) -> None:
+        self.path = path
+
+        content_key = None
+        if use_cache:
+            content_key = model_cache.content_key(path)
+            arrays = model_cache.load(path, 'asf', self.cache_version, content_key)
+            if arrays is not None:
+                try:
+                    self.load_arrays(arrays)
+                    return
+                except Exception:
+                    model_cache.discard(path, 'asf', self.cache_version, content_key)
+
+        with open(path, 'rb') as f:
             data = f.read()
 
-        self.polygons = self.import_polygons(data)
+        sections = self.index_sections(data)
+
+        self.polygons = self.import_polygons(data, sections['GL POLY'])
 
-        nodes_index, nodes_coordinates = self.import_nodes(data)
-        self.nodes_table = self.nodes_table.reindex(nodes_index)
-        self.nodes_table.loc[nodes_index] = nodes_coordinates
+        nodes_index, nodes_coordinates = self.import_nodes(data, sections['GP KNOT'])
+        self.nodes_table = self.make_nodes_table(nodes_index, nodes_coordinates)
 
-        elements_data = np.array(self.import_elements(data))
-        elements_index = elements_data[:, 0]
-        elements_nodes = elements_data[:, 1:]
-        self.elements_table = self.elements_table.reindex(elements_index)
-        self.elements_table.loc[:] = tuple(elements_nodes)
+        elements_data = self.import_elements(data, sections['GF ELEM'])
+        self.connectivity = Connectivity.from_padded(elements_data[:, 0], elements_data[:, 1:])
 
-        reinforcement_data = self.import_reinforcement(data)
+        reinforcement_data = self.import_reinforcement(data, sections['QM'])
         self.reinforcement_table = pd.DataFrame(data=reinforcement_data, columns=self.reinforcement_table.columns)
 
         self.calculate_element_centers()
 
+        if use_cache:
+            model_cache.store(path, 'asf', self.cache_version, self.dump_arrays(), content_key)
+
+    def dump_arrays(self) -> Dict[str, np.array]:
+        centers_columns = ['Element_center_X', 'Element_center_Y', 'Element_center_Z']
+        polygons = self.polygons if len(self.polygons) > 0 else [np.zeros((0, 3))]
+
+        return {'polygon_offsets': np.cumsum([0] + [len(polygon) for polygon in self.polygons]),
+                'polygon_points': np.concatenate(polygons),
+                'nodes_index': self.nodes_table.index.values,
+                'nodes_coordinates': self.nodes_table.loc[:, ['X', 'Y', 'Z']].values.astype(float),
+                'elements_index': self.connectivity.elements,
+                'elements_offsets': self.connectivity.offsets,
+                'elements_nodes': self.connectivity.nodes,
+                'elements_centers': self.elements_table.loc[:, centers_columns].values.astype(float),
+                'reinforcement': self.reinforcement_table.values.astype(float)}
+
+    def load_arrays(self, arrays: Dict[str, np.array]) -> None:
+        polygon_offsets = arrays['polygon_offsets']
+        self.polygons = [arrays['polygon_points'][polygon_offsets[i]:polygon_offsets[i + 1]]
+                         for i in range(len(polygon_offsets) - 1)]
+        self.nodes_table = self.make_nodes_table(arrays['nodes_index'], arrays['nodes_coordinates'])
+
+        self.connectivity = Connectivity(arrays['elements_index'], arrays['elements_offsets'], arrays['elements_nodes'])
+        self.elements_table = pd.DataFrame(data=arrays['elements_centers'], index=self.connectivity.elements,
+                                           columns=('Element_center_X', 'Element_center_Y', 'Element_center_Z'))
+
+        self.reinforcement_table = pd.DataFrame(data=arrays['reinforcement'], columns=self.reinforcement_table.columns)
+
     @staticmethod
-    def import_polygons(data: str) -> List[np.array]:
-        return_polygons = []
+    def make_nodes_table(nodes_index: np.array, nodes_coordinates: np.array) -> pd.DataFrame:
+        # pandas label lookups are about twice as fast on an int64 index
+        return pd.DataFrame(data=nodes_coordinates, index=nodes_index.astype(np.int64), columns=('X', 'Y', 'Z'))
+
+    def reinforcement_column(self, location: str) -> pd.Series:
+        return self.reinforcement_table.loc[:, location]
 
-        polygons = re.findall(r'GL POLY \d+', data)
+    @staticmethod
+    @Decorators.timed
+    def index_sections(data: Union[bytes, mmap.mmap]) -> Dict[str, List[Tuple[int, int]]]:
+        """Walk the file once and return byte ranges (start, end) of every section body.
+
+        Sections with a header (GL POLY, GP KNOT, GF ELEM) span the number of lines given in the header,
+        QM sections are runs of consecutive QM lines."""
+        sections = {'GL POLY': [], 'GP KNOT': [], 'GF ELEM': [], 'QM': []}
+        if len(data) == 0:
+            return sections
+
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        line_starts = np.concatenate(([0], np.flatnonzero(buffer == ord('\n')) + 1))
+        line_starts = line_starts[line_starts < len(buffer)]
+        line_ends = np.append(line_starts[1:] - 1, len(buffer) - int(data[-1:] == b'\n'))
+
+        first_chars = buffer[line_starts]
+        second_chars = buffer[np.minimum(line_starts + 1, len(buffer) - 1)]
+
+        for line in np.flatnonzero(first_chars == ord('G')):
+            header = data[line_starts[line]:line_ends[line]].decode().split()
+            key = ' '.join(header[:2])
+            if key not in sections:
+                continue
 
-        positions = []
-        for poly in polygons:
-            if len(positions) == 0:
-                positions.append(data.index(poly))
-            else:
-                positions.append(data.index(poly, positions[-1] + 1))
+            last_line = min(line + int(header[-1]), len(line_starts) - 1)
+            if last_line > line:
+                sections[key].append((int(line_starts[line + 1]), int(line_ends[last_line])))
 
-        for i, poly in enumerate(polygons):
-            position = positions[i]
-            n_points = int(re.search(r'\d+', poly).group())
-            polygon_points = data[position:].split('\n')[1:n_points + 1]
+        qm_lines = (first_chars == ord('Q')) & (second_chars == ord('M'))
+        qm_edges = np.diff(np.concatenate(([0], qm_lines.astype(np.int8), [0])))
+        for first_line, last_line in zip(np.flatnonzero(qm_edges == 1), np.flatnonzero(qm_edges == -1) - 1):
+            sections['QM'].append((int(line_starts[first_line]), int(line_ends[last_line])))
+
+        return sections
+
+    @staticmethod
+    def import_polygons(data: Union[str, bytes], ranges: Optional[List[Tuple[int, int]]] = None) -> List[np.array]:
+        if isinstance(data, str):
+            data = data.encode()
+        if ranges is None:
+            ranges = ReinforcementData.index_sections(data)['GL POLY']
+
+        return_polygons = []
+        for start, end in ranges:
+            polygon_points = data[start:end].decode().splitlines()
             polygon_points = [list(map(float, re.findall(r'[\d.\-e]+', point_line))) for point_line in polygon_points]
             return_polygons.append(np.array(polygon_points))
 
         return return_polygons
 
     @Decorators.timed
-    def import_reinforcement(self, data: str) -> List[List[float]]:
-        reinforcement = re.findall(r'QM [\d\s\-.,]+\n', data)
-        reinforcement = list(map(self.strip_reinforcement_line, reinforcement))
+    def import_reinforcement(self, data: bytes, ranges: List[Tuple[int, int]]) -> np.array:
+        reinforcement = [self.parse_reinforcement_block(data[start:end], self.line_number(data, start))
+                         for start, end in ranges]
 
-        return reinforcement
+        if len(reinforcement) == 0:
+            return np.zeros((0, 9))
 
-    @Decorators.timed
-    def import_elements(self, data: str) -> List[List[int]]:
-        element_data_first_line = re.search(r'GF ELEM \d+', data)
-        n_elements = int(element_data_first_line.group().split(' ')[-1])
+        return np.concatenate(reinforcement)
 
-        elements_data = data[element_data_first_line.end():].split('\n')[1:n_elements+1]
-        elements = list(map(self.strip_element_line, elements_data))
+    @Decorators.timed
+    def import_elements(self, data: bytes, ranges: List[Tuple[int, int]]) -> np.array:
+        assert len(ranges) > 0, 'ASF Elements import error\nGF ELEM section not found'
+        start, end = ranges[0]
 
-        return elements
+        return self.parse_element_block(data[start:end], self.line_number(data, start))
 
     @Decorators.timed
-    def import_nodes(self, data: str) -> (List[int], np.array):
-        nodes_data_first_line = re.search(r'GP KNOT \d+', data)
-        n_nodes = int(nodes_data_first_line.group().split(' ')[-1])
+    def import_nodes(self, data: bytes, ranges: List[Tuple[int, int]]) -> (np.array, np.array):
+        assert len(ranges) > 0, 'ASF Nodes import error\nGP KNOT section not found'
+        start, end = ranges[0]
+
+        return self.parse_node_block(data[start:end], self.line_number(data, start))
 
-        nodes_data = data[nodes_data_first_line.end():].split('\n')[1:n_nodes+1]
-        nodes = np.array(list(map(self.strip_node_line, nodes_data)))
+    @staticmethod
+    def line_number(data: Union[bytes, mmap.mmap], position: int, step: int = 1 << 24) -> int:
+        return sum(data[i:min(i + step, position)].count(b'\n') for i in range(0, position, step)) + 1
 
-        nodes_index = list(nodes[:, 0].astype(int))
-        nodes_coordinates = nodes[:, 1:]
+    @staticmethod
+    def tokens_per_line(block: bytes) -> np.array:
+        buffer = np.frombuffer(block, dtype=np.uint8)
+        newlines = buffer == ord('\n')
+        blanks = newlines | (buffer == ord(' ')) | (buffer == ord('\t')) | (buffer == ord('\r'))
+        token_starts = ~blanks & np.concatenate(([True], blanks[:-1]))
+        line_of_byte = np.cumsum(newlines) - newlines
 
-        return nodes_index, nodes_coordinates
+        return np.bincount(line_of_byte[token_starts], minlength=np.count_nonzero(newlines) + 1)
+
+    @staticmethod
+    def raise_block_error(block: bytes, line_parser, first_line: int, name: str):
+        for n, line in enumerate(block.decode().splitlines()):
+            try:
+                line_parser(line)
+            except (AssertionError, ValueError, IndexError) as e:
+                raise AssertionError(f'ASF {name} import error at line {first_line + n}\n{line}') from e
+
+        last_line = first_line + block.count(b'\n')
+        raise AssertionError(f'ASF {name} import error at lines {first_line}-{last_line}')
+
+    @staticmethod
+    def parse_reinforcement_block(block: bytes, first_line: int = 1) -> np.array:
+        """QM lines to (n, 9) float matrix: element center XYZ and Top_X, Top_Y, Lat_X, Bot_X, Bot_Y, Lat_Y"""
+        tokens_per_line = ReinforcementData.tokens_per_line(block)
+        n_tokens = tokens_per_line[0]
+
+        try:
+            assert n_tokens >= 10 and np.all(tokens_per_line == n_tokens)
+            tokens = np.array(block.split()).reshape(-1, n_tokens)
+            assert np.all(tokens[:, 0] == b'QM')
+            return tokens[:, -9:].astype(np.float64)
+        except (AssertionError, ValueError):
+            ReinforcementData.raise_block_error(block, ReinforcementData.strip_reinforcement_line, first_line,
+                                                'Reinforcement')
+
+    @staticmethod
+    def parse_element_block(block: bytes, first_line: int = 1) -> np.array:
+        """GF ELEM lines to (n, 5) int matrix: element index and four nodes, 0 for missing nodes"""
+        lines = block.splitlines()
+        width = len(lines[0])
+
+        try:
+            assert width % 5 == 0 and all(len(line) == width for line in lines)
+            columns = np.array(lines, dtype=f'S{width}').view(f'S{width // 5}').reshape(-1, 5)
+            return columns.astype(np.int64)
+        except (AssertionError, ValueError):
+            pass
+
+        try:
+            return np.array(list(map(ReinforcementData.strip_element_line, block.decode().splitlines())),
+                            dtype=np.int64)
+        except (AssertionError, ValueError):
+            ReinforcementData.raise_block_error(block, ReinforcementData.strip_element_line, first_line, 'Elements')
+
+    @staticmethod
+    def parse_node_block(block: bytes, first_line: int = 1) -> (np.array, np.array):
+        """GP KNOT lines to int32 node indices and (n, 3) float64 coordinates"""
+        tokens_per_line = ReinforcementData.tokens_per_line(block)
+
+        try:
+            assert np.all(tokens_per_line == 4)
+            tokens = np.array(block.split()).reshape(-1, 4)
+            return tokens[:, 0].astype(np.int32), tokens[:, 1:].astype(np.float64)
+        except (AssertionError, ValueError):
+            ReinforcementData.raise_block_error(block, ReinforcementData.strip_node_line, first_line, 'Nodes')
 
     @staticmethod
     def strip_reinforcement_line(line: str) -> List[float]:
@@ -117,19 +266,127 @@ class ReinforcementData:
 
     @Decorators.timed
     def calculate_element_centers(self):
-        coordinates = list(map(self.get_coordinates, self.elements_table.values))
-        element_centers = list(map(self.get_mean, coordinates))
+        element_centers = MeshTools.element_centers(self.connectivity,
+                                                    self.nodes_table.index.values,
+                                                    self.nodes_table.loc[:, ['X', 'Y', 'Z']].values)
 
-        elements_centers_table = pd.DataFrame(data=element_centers, index=self.elements_table.index,
-                                              columns=('Element_center_X', 'Element_center_Y', 'Element_center_Z'))
+        self.elements_table = pd.DataFrame(data=element_centers, index=self.connectivity.elements,
+                                           columns=('Element_center_X', 'Element_center_Y', 'Element_center_Z'))
 
-        self.elements_table = pd.concat([self.elements_table, elements_centers_table], axis=1)
 
-    def get_coordinates(self, nodes) -> np.array:
-        nodes = nodes[nodes != 0]
-        coordinates = self.nodes_table.loc[nodes, ['X', 'Y', 'Z']].values.astype(float)
-        return coordinates
+class MappedReinforcementData(ReinforcementData):
+    """ReinforcementData backed by a memory-mapped ASF file.
 
-    @staticmethod
-    def get_mean(array) -> np.array:
-        return np.mean(array, axis=0)
+    Section offsets are indexed on opening, every table is parsed in line-aligned chunks the first time it is used,
+    QM values are parsed one location at a time."""
+    chunk_size = 1 << 18
+    reinforcement_columns = ('Element_center_X', 'Element_center_Y', 'Element_center_Z',
+                             'Top_X', 'Top_Y', 'Lat_X', 'Bot_X', 'Bot_Y', 'Lat_Y')
+
+    def __init__(self, path: str):
+        self.path = path
+        self.parsed = {}
+
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.sections = self.index_sections(self.buffer)
+
+    def close(self):
+        self.buffer.close()
+
+    def import_asf(self, path: str) -> None:
+        raise TypeError('MappedReinforcementData is opened on creation')
+
+    def chunks(self, ranges: List[Tuple[int, int]]) -> Iterator[Tuple[bytes, int]]:
+        for start, end in ranges:
+            first_line = self.line_number(self.buffer, start)
+
+            while start < end:
+                chunk_end = self.buffer.find(b'\n', min(start + self.chunk_size, end), end)
+                chunk_end = end if chunk_end == -1 else chunk_end
+
+                chunk = self.buffer[start:chunk_end]
+                yield chunk, first_line
+
+                first_line += chunk.count(b'\n') + 1
+                start = chunk_end + 1
+
+    @property
+    def polygons(self) -> List[np.array]:
+        if 'polygons' not in self.parsed:
+            self.parsed['polygons'] = self.import_polygons(self.buffer, self.sections['GL POLY'])
+        return self.parsed['polygons']
+
+    @polygons.setter
+    def polygons(self, value: List[np.array]):
+        self.parsed['polygons'] = value
+
+    @property
+    def nodes_table(self) -> pd.DataFrame:
+        if 'nodes_table' not in self.parsed:
+            assert len(self.sections['GP KNOT']) > 0, 'ASF Nodes import error\nGP KNOT section not found'
+
+            nodes = [self.parse_node_block(chunk, first_line)
+                     for chunk, first_line in self.chunks(self.sections['GP KNOT'][:1])]
+            self.parsed['nodes_table'] = self.make_nodes_table(np.concatenate([item[0] for item in nodes]),
+                                                               np.concatenate([item[1] for item in nodes]))
+        return self.parsed['nodes_table']
+
+    @nodes_table.setter
+    def nodes_table(self, value: pd.DataFrame):
+        self.parsed['nodes_table'] = value
+
+    @property
+    def connectivity(self) -> Connectivity:
+        if 'connectivity' not in self.parsed:
+            assert len(self.sections['GF ELEM']) > 0, 'ASF Elements import error\nGF ELEM section not found'
+
+            elements_data = np.concatenate([self.parse_element_block(chunk, first_line)
+                                            for chunk, first_line in self.chunks(self.sections['GF ELEM'][:1])])
+            self.parsed['connectivity'] = Connectivity.from_padded(elements_data[:, 0], elements_data[:, 1:])
+        return self.parsed['connectivity']
+
+    @connectivity.setter
+    def connectivity(self, value: Connectivity):
+        self.parsed['connectivity'] = value
+
+    @property
+    def elements_table(self) -> pd.DataFrame:
+        if 'elements_table' not in self.parsed:
+            self.calculate_element_centers()
+        return self.parsed['elements_table']
+
+    @elements_table.setter
+    def elements_table(self, value: pd.DataFrame):
+        self.parsed['elements_table'] = value
+
+    @property
+    def reinforcement_table(self) -> pd.DataFrame:
+        if 'reinforcement_table' not in self.parsed:
+            self.parsed['reinforcement_table'] = pd.DataFrame(data=self.import_reinforcement_columns(slice(None)),
+                                                              columns=self.reinforcement_columns)
+            for location in self.reinforcement_columns:
+                self.parsed.pop(location, None)
+        return self.parsed['reinforcement_table']
+
+    @reinforcement_table.setter
+    def reinforcement_table(self, value: pd.DataFrame):
+        self.parsed['reinforcement_table'] = value
+
+    def reinforcement_column(self, location: str) -> pd.Series:
+        if 'reinforcement_table' in self.parsed:
+            return self.parsed['reinforcement_table'].loc[:, location]
+
+        if location not in self.parsed:
+            values = self.import_reinforcement_columns(self.reinforcement_columns.index(location))
+            self.parsed[location] = pd.Series(data=values, name=location)
+        return self.parsed[location]
+
+    def import_reinforcement_columns(self, columns: Union[int, slice]) -> np.array:
+        values = [self.parse_reinforcement_block(chunk, first_line)[:, columns]
+                  for chunk, first_line in self.chunks(self.sections['QM'])]
+
+        if len(values) == 0:
+            return np.zeros((0, 9))[:, columns]
+
+        return np.concatenate(values)
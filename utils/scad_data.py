@@ -1,179 +1,412 @@
 from utils.decorators import Decorators
-from typing import List
+from utils.model_cache import model_cache
+from utils.mesh_tools import Connectivity
+from typing import Dict, List, Optional, Sequence
+from itertools import chain
 import pandas as pd
 import numpy as np
+import hashlib
 import re
 
 
-scad_parser_regex = r'\w\s\d=\".:\-/,+\';'
+scad_document_start_regex = re.compile(r'\(\s*(\d+)\s*[;/]')
+whitespace_regex = re.compile(r'\s+')
+element_range_regex = re.compile(r'(\d+)\s*-\s*(\d+)|(\d+)\s+r\s+(\d+)\s+(\d+)|(\d+)|(\S+)')
 
 
 class SCADData:
     def __init__(self):
         self.nodes_table = None
         self.elements_table = None
+        self.connectivity = None
+        self.directions = np.zeros((0, 3))
         self.reinforcement_groups = {}
 
+    cache_version = 4
+    rotation_types = ('EX', 'EY')
+
     @Decorators.timed
-    def import_txt(self, path: str) -> None:
+    def import_txt(self, path: str, use_cache: bool = True, groups: Optional[Sequence[str]] = None) -> None:
+        """Import SCAD model. With groups only the elements of these reinforcement groups and their nodes are read"""
+        cache_kind = 'scad' if groups is None else f'scad-{self.groups_hash(groups)}'
+        content_key = None
+        if use_cache:
+            content_key = model_cache.content_key(path)
+            arrays = model_cache.load(path, cache_kind, self.cache_version, content_key)
+            if arrays is not None:
+                try:
+                    self.load_arrays(arrays)
+                    return
+                except Exception:
+                    model_cache.discard(path, cache_kind, self.cache_version, content_key)
+
         with open(path) as f:
             data = f.read()
 
-        self.nodes_table = self.import_nodes_form_txt_data(data)
-        self.elements_table = self.import_elements_from_txt_data(data)
+        documents = self.split_documents(data, (1, 4, 33, 53), verbatim=(1, 4))
+
+        self.reinforcement_groups = self.parse_reinforcement_groups_document(documents[53])
+
+        elements, nodes = None, None
+        if groups is not None:
+            elements = np.unique(np.concatenate([np.zeros(0, dtype=np.int64)] +
+                                                [self.group_elements(name) for name in groups]))
+            self.reinforcement_groups = {name: self.reinforcement_groups[name] for name in groups}
+
+        self.elements_table, self.connectivity = self.parse_elements_document(documents[1], elements)
+
+        if groups is not None:
+            nodes = np.unique(self.connectivity.nodes)
+
+        self.nodes_table = self.parse_nodes_document(documents[4], nodes)
+
+        self.check_node_references()
 
-        for element_type in self.elements_table.Element_type.unique():
-            nodes = np.stack(self.elements_table.query(f'Element_type == {element_type}').Nodes)
-            node_min_index = np.min(nodes)
-            node_max_index = np.max(nodes)
+        force_direction_table, self.directions = self.parse_force_directions_document(documents[33])
+        self.set_force_directions(force_direction_table)
 
-            for node_index in [node_min_index, node_max_index]:
-                assert node_index in self.nodes_table.index, f'Node {node_index} not in Nodes table'
+        if use_cache:
+            model_cache.store(path, cache_kind, self.cache_version, self.dump_arrays(), content_key)
 
-        force_direction_table = self.import_force_directions_from_txt_data(data)
-        self.elements_table = pd.concat([self.elements_table, force_direction_table], axis=1)
+    def check_node_references(self) -> None:
+        dangling_nodes = self.connectivity.dangling_nodes(self.nodes_table.index.values)
+        assert len(dangling_nodes) == 0, f'Nodes {", ".join(map(str, dangling_nodes))} not in Nodes table'
 
-        self.reinforcement_groups = self.import_reinforcement_groups_from_txt_data(data)
+    @staticmethod
+    def groups_hash(groups: Sequence[str]) -> str:
+        return hashlib.sha1('\n'.join(sorted(groups)).encode()).hexdigest()[:12]
+
+    def dump_arrays(self) -> Dict[str, np.array]:
+        group_names = list(self.reinforcement_groups.keys())
+        group_ranges = [self.reinforcement_groups[name] for name in group_names]
+
+        return {'nodes_index': self.nodes_table.index.values,
+                'nodes_coordinates': self.nodes_table.loc[:, ['X', 'Y', 'Z']].values.astype(float),
+                'elements_index': self.elements_table.index.values,
+                'elements_type': self.elements_table.Element_type.values.astype(np.int64),
+                'elements_stiffness': self.elements_table.Stiffness.values.astype(np.int64),
+                'connectivity_elements': self.connectivity.elements,
+                'connectivity_offsets': self.connectivity.offsets,
+                'connectivity_nodes': self.connectivity.nodes,
+                'rotation_code': self.elements_table.Rotation_code.values,
+                'direction_id': self.elements_table.Direction_id.values,
+                'directions': self.directions,
+                'group_names': np.array(group_names, dtype=str),
+                'group_offsets': np.cumsum([0] + [len(ranges) for ranges in group_ranges]),
+                'group_ranges': np.concatenate([np.zeros((0, 3), dtype=np.int64)] + group_ranges)}
+
+    def load_arrays(self, arrays: Dict[str, np.array]) -> None:
+        self.nodes_table = pd.DataFrame(data=arrays['nodes_coordinates'], index=arrays['nodes_index'],
+                                        columns=('X', 'Y', 'Z'))
+
+        self.connectivity = Connectivity(arrays['connectivity_elements'], arrays['connectivity_offsets'],
+                                         arrays['connectivity_nodes'])
+
+        self.elements_table = pd.DataFrame(index=arrays['elements_index'],
+                                           data={'Element_type': arrays['elements_type'],
+                                                 'Stiffness': arrays['elements_stiffness'],
+                                                 'Rotation_code': arrays['rotation_code'],
+                                                 'Direction_id': arrays['direction_id']})
+        self.directions = arrays['directions']
+
+        offsets = arrays['group_offsets']
+        self.reinforcement_groups = {str(name): arrays['group_ranges'][offsets[i]:offsets[i + 1]]
+                                     for i, name in enumerate(arrays['group_names'])}
 
+    @staticmethod
     @Decorators.timed
-    def import_force_directions_from_txt_data(self, data: str) -> pd.DataFrame:
-        force_direction_table = pd.DataFrame(columns=('Rotation_type', 'Direction'))
+    def split_documents(data: str, numbers: Sequence[int] = None, verbatim: Sequence[int] = ()) -> Dict[int, str]:
+        """Split SCAD text to documents "(N/.../)" in one scan, jumping over document bodies with str.find and
+        stopping once all requested documents are found. Returns bodies of the documents with the given numbers
+        (all by default) with whitespace runs outside of quoted strings replaced by single spaces. Verbatim documents
+        are returned as is, for parsers that tokenize records with str.split"""
+        documents = {}
+        missing = None if numbers is None else set(numbers)
+        position = 0
+        while missing is None or len(missing) > 0:
+            match = scad_document_start_regex.search(data, position)
+            if match is None:
+                break
+
+            end = SCADData.find_document_end(data, match.end())
+            if end < 0:
+                position = match.end()
+                continue
+
+            number = int(match.group(1))
+            if number in verbatim:
+                documents[number] = data[match.end():end]
+            elif numbers is None or number in numbers:
+                documents[number] = SCADData.normalize_whitespace(data[match.end():end])
 
-        force_axis = re.search(rf'\(33/[{scad_parser_regex}]+\)', data).group().replace('\n', ' ')
-        force_axis = force_axis.split('/')
-        force_axis = [line.replace('  ', ' ').strip() for line in force_axis if 'EX' in line or 'EY' in line]
+            if missing is not None:
+                missing.discard(number)
+            position = end + 1
+
+        for number in numbers or ():
+            assert number in documents, f'SCAD import error\nDocument ({number}/ not found'
+
+        return documents
+
+    @staticmethod
+    def find_document_end(data: str, start: int) -> int:
+        """Position of the ")" closing a document body that starts at start, skipping quoted strings.
+        -1 when the document is not closed"""
+        position = start
+        while True:
+            end = data.find(')', position)
+            quote = data.find('"', position, len(data) if end < 0 else end)
+            if quote < 0:
+                return end
+
+            quote_end = data.find('"', quote + 1)
+            if quote_end < 0:
+                return -1
+            position = quote_end + 1
 
+    @staticmethod
+    def normalize_whitespace(document: str) -> str:
+        pieces = document.split('"')
+        pieces[::2] = [whitespace_regex.sub(' ', piece) for piece in pieces[::2]]
+        pieces[1::2] = [piece.replace('\n', ' ') for piece in pieces[1::2]]
+
+        return '"'.join(pieces)
+
+    def set_force_directions(self, force_direction_table: pd.DataFrame) -> None:
+        """Add Rotation_code and Direction_id columns to elements table, -1 for elements without force direction"""
+        assert force_direction_table.index.is_unique, 'SCAD force directions import error\nDuplicated elements'
+
+        for column, dtype in [('Rotation_code', np.int8), ('Direction_id', np.int32)]:
+            self.elements_table[column] = force_direction_table[column].reindex(self.elements_table.index,
+                                                                                fill_value=-1).astype(dtype)
+
+    def direction_vectors(self, direction_ids: np.array) -> np.array:
+        """(n, 3) force direction vectors of direction ids, NaN for -1"""
+        directions = np.vstack([self.directions, np.full((1, 3), np.nan)])
+        return directions[np.asarray(direction_ids)]
+
+    def import_force_directions_from_txt_data(self, data: str) -> (pd.DataFrame, np.array):
+        return self.parse_force_directions_document(self.split_documents(data, (33,))[33])
+
+    def import_reinforcement_groups_from_txt_data(self, data: str) -> dict:
+        return self.parse_reinforcement_groups_document(self.split_documents(data, (53,))[53])
+
+    def import_elements_from_txt_data(self, data: str) -> (pd.DataFrame, Connectivity):
+        return self.parse_elements_document(self.split_documents(data, (1,))[1])
+
+    def import_nodes_form_txt_data(self, data: str) -> pd.DataFrame:
+        return self.parse_nodes_document(self.split_documents(data, (4,))[4])
+
+    @Decorators.timed
+    def parse_force_directions_document(self, document: str) -> (pd.DataFrame, np.array):
+        """Table of Rotation_code and Direction_id of elements and (n, 3) array of unique directions"""
+        force_axis = [line.strip() for line in document.split('/') if 'EX' in line or 'EY' in line]
+
+        rotation_codes = np.zeros(len(force_axis), dtype=np.int8)
+        line_directions = np.zeros((len(force_axis), 3))
+        line_elements = []
         for n, line in enumerate(force_axis):
             line_info, elements = line.split(':')
 
             rotation_type, x, y, z = line_info.split(' ')[0:4]
-            element_indices = self.get_element_list_from_string(elements)
+            assert rotation_type in self.rotation_types, f'SCAD force directions import error\n{line}'
 
-            rotation_type_series = pd.Series(index=element_indices,
-                                             data=rotation_type,
-                                             name='Rotation_type')
+            rotation_codes[n] = self.rotation_types.index(rotation_type)
+            line_directions[n] = float(x), float(y), float(z)
+            line_elements.append(self.expand_element_ranges(self.get_element_ranges_from_string(elements)))
 
-            direction_series = pd.Series(index=element_indices,
-                                         data=[[float(x), float(y), float(z)]
-                                               for _ in range(len(element_indices))],
-                                         name='Direction')
+        directions, direction_ids = np.unique(line_directions, axis=0, return_inverse=True)
+        counts = [len(elements) for elements in line_elements]
 
-            new_frame = pd.concat([rotation_type_series, direction_series], axis=1)
-            force_direction_table = pd.concat([force_direction_table, new_frame])
+        force_direction_table = pd.DataFrame(index=np.concatenate([np.zeros(0, dtype=np.int64)] + line_elements),
+                                             data={'Rotation_code': np.repeat(rotation_codes, counts),
+                                                   'Direction_id': np.repeat(direction_ids.ravel(),
+                                                                             counts).astype(np.int32)})
 
-        return force_direction_table
+        return force_direction_table, directions
 
     @Decorators.timed
-    def import_reinforcement_groups_from_txt_data(self, data: str) -> dict:
+    def parse_reinforcement_groups_document(self, document: str) -> dict:
         reinforcement_groups_dict = {}
 
-        reinforcement_groups = re.search(rf'\(53/[{scad_parser_regex}]+\)', data).group().replace('\n', ' ')
-        reinforcement_groups = reinforcement_groups.split('/')
-
-        for line in reinforcement_groups:
+        for line in document.split('/'):
             if 'Name' in line:
-                name = re.search(rf'Name="[{scad_parser_regex}]+"', line).group().split('"')[1]
-                elements = line.split(':')[-1].replace('  ', ' ')
+                name = re.search(r'Name="([^"]*)"', line).group(1)
+                elements = line.split(':')[-1]
 
-                element_indices = self.get_element_list_from_string(elements)
-                reinforcement_groups_dict[name] = element_indices
+                reinforcement_groups_dict[name] = self.get_element_ranges_from_string(elements)
 
         return reinforcement_groups_dict
 
     @Decorators.timed
-    def import_elements_from_txt_data(self, data: str) -> pd.DataFrame:
-        elements_table = pd.DataFrame(columns=('Element_type', 'Stiffness'))
-        nodes_series = pd.Series(name='Nodes', dtype=object)
+    def parse_elements_document(self, document: str,
+                                elements: Optional[np.array] = None) -> (pd.DataFrame, Connectivity):
+        """Elements table and connectivity of all elements or only of the given elements"""
+        records = document.split('/')[:-1]
+
+        elements_index = None
+        if elements is not None:
+            records, elements_index = self.select_record_chains(records, elements)
+
+        segments = []
+        plain_records = []
+        last_element = None
+        for record in records:
+            if 'r' not in record:
+                plain_records.append(record.split())
+                continue
 
-        elements_data = re.search(rf'\(1/[{scad_parser_regex}]+\)', data).group().replace('\n', ' ')
-        while '  ' in elements_data:
-            elements_data = elements_data.replace('  ', ' ')
+            if len(plain_records) > 0:
+                segments.append(self.records_to_csr(plain_records))
+                last_element = np.array(plain_records[-1], dtype=np.int64)
+                plain_records = []
 
-        elements_data = elements_data.replace('(1/', '').split('/')
-        repeat_operators_positions = [-1] + [i for i in range(len(elements_data)) if 'r' in elements_data[i]] + [-1]
-        for i in range(1, len(repeat_operators_positions)):
-            pos_prev = repeat_operators_positions[i-1] + 1
-            pos = repeat_operators_positions[i]
+            assert last_element is not None, f'SCAD elements import error\nNothing to repeat with "{record.strip()}"'
 
-            elements_data_i = elements_data[pos_prev:pos]
-            elements_data_i = [list(map(int, element.strip().split(' '))) for element in elements_data_i]
+            n_list, k_list = self.scad_repeat_line_operator(record)
+            increments = np.zeros(len(last_element), dtype=np.int64)
+            k_list = np.array(k_list[:len(last_element)]).astype(np.int64)
+            increments[:len(k_list)] = k_list
 
-            element_indices = list(range(len(elements_table), len(elements_table) + len(elements_data_i)))
-            new_elements_table = pd.DataFrame(index=element_indices,
-                                              data=[element[:2] for element in elements_data_i],
-                                              columns=('Element_type', 'Stiffness'))
-            new_nodes_series = pd.Series(index=element_indices,
-                                         data=[element[2:] for element in elements_data_i],
-                                         name='Nodes', dtype=object)
+            repeated_elements = last_element + np.arange(1, n_list[1] + 1)[:, None] * increments
+            if len(repeated_elements) > 0:
+                last_element = repeated_elements[-1]
 
-            if pos != -1:
-                n_list, k_list = self.scad_repeat_line_operator(elements_data[pos])
-                n2 = n_list[1]
-                k_type = int(k_list[0])
-                k_stiffness = int(k_list[1])
-                k_nodes = k_list[2:]
+            lengths = np.full(len(repeated_elements), len(last_element) - 2)
+            segments.append((repeated_elements[:, :2], lengths, repeated_elements[:, 2:].ravel()))
 
-                for _ in range(n2):
-                    index_of_last = new_nodes_series.index.max()
+        if len(plain_records) > 0:
+            segments.append(self.records_to_csr(plain_records))
 
-                    new_elements_table.loc[index_of_last + 1] = (
-                        new_elements_table.iloc[-1].Element_type + k_type,
-                        new_elements_table.iloc[-1].Stiffness + k_stiffness)
+        n_elements = sum(len(segment[1]) for segment in segments)
+        n_nodes = sum(len(segment[2]) for segment in segments)
 
-                    new_nodes_series.loc[index_of_last + 1] = [new_nodes_series.iloc[-1][i] + int(k_nodes[i])
-                                                               for i in range(len(k_nodes))]
+        heads = np.empty((n_elements, 2), dtype=np.int64)
+        lengths = np.empty(n_elements, dtype=np.int64)
+        nodes = np.empty(n_nodes, dtype=np.int64)
 
-            elements_table = pd.concat([elements_table, new_elements_table], axis=0)
-            nodes_series = pd.concat([nodes_series, new_nodes_series], axis=0)
+        element_position, node_position = 0, 0
+        for segment_heads, segment_lengths, segment_nodes in segments:
+            heads[element_position:element_position + len(segment_lengths)] = segment_heads
+            lengths[element_position:element_position + len(segment_lengths)] = segment_lengths
+            nodes[node_position:node_position + len(segment_nodes)] = segment_nodes
 
-        elements_table = pd.concat([elements_table, nodes_series], axis=1)
-        elements_table.index = range(1, len(elements_table) + 1)
+            element_position += len(segment_lengths)
+            node_position += len(segment_nodes)
 
-        return elements_table
+        if elements_index is None:
+            elements_index = np.arange(1, n_elements + 1)
 
-    @Decorators.timed
-    def import_nodes_form_txt_data(self, data: str) -> pd.DataFrame:
-        nodes_table = pd.DataFrame(columns=('X', 'Y', 'Z'))
+        elements_table = pd.DataFrame(index=elements_index, data={'Element_type': heads[:, 0],
+                                                                  'Stiffness': heads[:, 1]})
+        connectivity = Connectivity(elements_index, np.concatenate(([0], np.cumsum(lengths))), nodes)
 
-        nodes_data = re.search(rf'\(4/[{scad_parser_regex}]+\)', data).group().replace('\n', ' ')
-        while '  ' in nodes_data:
-            nodes_data = nodes_data.replace('  ', ' ')
-        nodes_data = nodes_data.replace('(4/', '').replace(')', '').split('/')
+        if elements is not None:
+            elements = np.unique(elements)
+            connectivity = connectivity.subset(elements)
+            elements_table = elements_table.loc[elements]
 
-        repeat_operators_positions = [-1] + [i for i in range(len(nodes_data)) if 'r' in nodes_data[i]] + [-1]
-        for i in range(1, len(repeat_operators_positions)):
-            pos_prev = repeat_operators_positions[i-1] + 1
-            pos = repeat_operators_positions[i]
+        return elements_table, connectivity
 
-            nodes_data_i = nodes_data[pos_prev:pos]
-            if len(nodes_data_i) == 0:
+    @Decorators.timed
+    def parse_nodes_document(self, document: str, nodes: Optional[np.array] = None) -> pd.DataFrame:
+        """Nodes table of all nodes or only of the given nodes"""
+        records = document.split('/')[:-1]
+
+        nodes_index = None
+        if nodes is not None:
+            records, nodes_index = self.select_record_chains(records, nodes)
+
+        segments = []
+        plain_records = []
+        last_node = None
+        for record in records:
+            if 'r' not in record:
+                plain_records.append(record.split())
                 continue
 
-            nodes_data_i = [list(map(float, node.strip().split(' '))) for node in nodes_data_i]
-            nodes_data_i = list(map(self.add_zeros, nodes_data_i))
+            if len(plain_records) > 0:
+                segments.append(self.records_to_coordinates(plain_records))
+                last_node = segments[-1][-1]
+                plain_records = []
+
+            assert last_node is not None, f'SCAD nodes import error\nNothing to repeat with "{record.strip()}"'
+
+            n_list, k_list = self.scad_repeat_line_operator(record)
+            increments = np.array(self.add_zeros(k_list[:3]))
+
+            segments.append(last_node + np.arange(1, n_list[1] + 1)[:, None] * increments)
+            if len(segments[-1]) > 0:
+                last_node = segments[-1][-1]
 
-            nodes_coordinates = np.zeros((len(nodes_data_i), 3)) + np.array(nodes_data_i)
-            nodes_indices = list(range(len(nodes_table), len(nodes_table) + len(nodes_coordinates)))
-            new_nodes_table = pd.DataFrame(index=nodes_indices, data=nodes_coordinates, columns=('X', 'Y', 'Z'))
+        if len(plain_records) > 0:
+            segments.append(self.records_to_coordinates(plain_records))
 
-            if pos != -1:
-                n_list, k_list = self.scad_repeat_line_operator(nodes_data[pos])
+        nodes_coordinates = np.empty((sum(len(segment) for segment in segments), 3))
 
-                n_2 = n_list[1]
-                k_x = k_list[0]
-                k_y = 0 if len(k_list) < 2 else k_list[1]
-                k_z = 0 if len(k_list) < 3 else k_list[2]
+        position = 0
+        for segment in segments:
+            nodes_coordinates[position:position + len(segment)] = segment
+            position += len(segment)
 
-                for i_repeat in range(n_2):
-                    new_nodes_table.loc[max(nodes_indices) + i_repeat + 1] = (new_nodes_table.iloc[-1].X + k_x,
-                                                                              new_nodes_table.iloc[-1].Y + k_y,
-                                                                              new_nodes_table.iloc[-1].Z + k_z)
+        if nodes_index is None:
+            nodes_index = np.arange(1, len(nodes_coordinates) + 1)
 
-            nodes_table = pd.concat([nodes_table, new_nodes_table], axis=0)
+        nodes_table = pd.DataFrame(index=nodes_index, data=nodes_coordinates, columns=('X', 'Y', 'Z'))
+        if nodes is not None:
+            nodes_table = nodes_table.loc[np.isin(nodes_index, nodes)]
 
-        nodes_table.index = list(range(1, len(nodes_table) + 1))
         return nodes_table
 
+    @staticmethod
+    def select_record_chains(records: List[str], numbers: np.array) -> (List[str], np.array):
+        """Records needed for the items with the given numbers and numbers of all items of these records.
+        Every plain record starts a chain with the repeat records after it, chains are selected as a whole"""
+        is_repeat = np.fromiter(('r' in record for record in records), dtype=bool, count=len(records))
+
+        counts = np.ones(len(records), dtype=np.int64)
+        counts[is_repeat] = [SCADData.scad_repeat_line_operator(records[i])[0][1] for i in np.flatnonzero(is_repeat)]
+
+        ends = np.cumsum(counts)
+        chains = np.cumsum(~is_repeat)
+
+        numbers = np.asarray(numbers)
+        item_records = np.searchsorted(ends, numbers[(numbers >= 1) & (numbers <= counts.sum())])
+        selected = np.flatnonzero(np.isin(chains, chains[item_records]))
+
+        selected_numbers = SCADData.expand_element_ranges(np.column_stack([ends[selected] - counts[selected] + 1,
+                                                                           ends[selected] + 1,
+                                                                           np.ones(len(selected), dtype=np.int64)]))
+
+        return [records[i] for i in selected], selected_numbers
+
+    @staticmethod
+    def records_to_csr(records: List[List[str]]) -> (np.array, np.array, np.array):
+        """Split records to first two values and the rest in CSR form"""
+        lengths = np.fromiter(map(len, records), dtype=np.int64, count=len(records))
+        values = np.array(list(chain.from_iterable(records))).astype(np.int64)
+
+        assert np.all(lengths >= 2), f'SCAD import error\n{records[np.argmax(lengths < 2)]}'
+
+        heads_positions = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        heads = np.column_stack([values[heads_positions], values[heads_positions + 1]])
+        tails = np.delete(values, np.concatenate([heads_positions, heads_positions + 1]))
+
+        return heads, lengths - 2, tails
+
+    @staticmethod
+    def records_to_coordinates(records: List[List[str]]) -> np.array:
+        """Node records with up to three coordinates to (n, 3) matrix, missing coordinates are zeros"""
+        lengths = np.fromiter(map(len, records), dtype=np.int64, count=len(records))
+        values = np.array(list(chain.from_iterable(records))).astype(float)
+
+        assert np.all(lengths <= 3), f'SCAD nodes import error\n{records[np.argmax(lengths > 3)]}'
+
+        coordinates = np.zeros((len(records), 3))
+        coordinates[np.arange(3) < lengths[:, None]] = values
+
+        return coordinates
+
     @staticmethod
     def add_zeros(node: List[float]) -> List[float]:
         while len(node) < 3:
@@ -182,29 +415,33 @@ class SCADData:
 
     @staticmethod
     def get_element_list_from_string(s: str) -> List[int]:
-        element_indices = []
-
-        ranges = re.findall(r'\d+-\d+', s)
-        for element_range in ranges:
-            s = s.replace(element_range, '').replace('  ', ' ')
-            element_range = element_range.split('-')
-            element_indices += list(range(int(element_range[0]), int(element_range[1]) + 1))
-
-        r_ranges = re.findall(r'\d+ r \d+ \d+', s)
-        for element_range in r_ranges:
-            s = s.replace(element_range, '').replace('  ', ' ')
-            element_range = element_range.split(' ')
-            element_indices += list(range(int(element_range[0]),
-                                          int(element_range[2]) + 1,
-                                          int(element_range[3])
-                                          )
-                                    )
-
-        for element in s.split(' '):
-            if len(element) > 0:
-                element_indices.append(int(element))
-
-        return element_indices
+        return SCADData.expand_element_ranges(SCADData.get_element_ranges_from_string(s)).tolist()
+
+    @staticmethod
+    def get_element_ranges_from_string(s: str) -> np.array:
+        """Element list "1-5 6 r 12 3 13" to (n, 3) array of range(start, stop, step) arguments"""
+        ranges = []
+        for match in element_range_regex.finditer(s):
+            first, last, r_first, r_last, r_step, element, unknown = match.groups()
+            assert unknown is None, f'SCAD element list import error\nUnknown token "{unknown}" in "{s.strip()}"'
+
+            if element is not None:
+                ranges.append((int(element), int(element) + 1, 1))
+            elif first is not None:
+                ranges.append((int(first), int(last) + 1, 1))
+            else:
+                ranges.append((int(r_first), int(r_last) + 1, int(r_step)))
+
+        return np.array(ranges, dtype=np.int64).reshape(-1, 3)
+
+    @staticmethod
+    def expand_element_ranges(ranges: np.array) -> np.array:
+        return np.concatenate([np.zeros(0, dtype=np.int64)] + [np.arange(*element_range, dtype=np.int64)
+                                                               for element_range in ranges.tolist()])
+
+    def group_elements(self, name: str) -> np.array:
+        assert name in self.reinforcement_groups, f'Reinforcement group "{name}" not in SCAD data'
+        return self.expand_element_ranges(self.reinforcement_groups[name])
 
     @staticmethod
     def scad_repeat_line_operator(s: str) -> tuple:
@@ -217,7 +454,7 @@ class SCADData:
         n = n.strip()
         k = k.strip()
 
-        n_list = [int(n_i) for n_i in n.split(' ') if len(n_i) > 0]
-        k_list = [float(k_i) for k_i in k.split(' ') if len(k_i) > 0]
+        n_list = [int(n_i) for n_i in n.split()]
+        k_list = [float(k_i) for k_i in k.split()]
 
         return n_list, k_list